@@ -74,94 +74,249 @@
 # if __name__ == "__main__":
 #     train_xgboost()
 
-import pandas as pd
+import argparse
+import shutil
+import tempfile
 import joblib
+import numpy as np
+import pandas as pd
 import xgboost as xgb
 from imblearn.over_sampling import SMOTE
 from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import LabelEncoder
 from sklearn.metrics import confusion_matrix
-from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score, confusion_matrix
-
-# Function to preprocess data
-def preprocess_data(df, label_encoders=None):
-    df = df.drop(columns=['trans_num', 'merchant'], errors='ignore')
+from batch_scoring import DEFAULT_CHUNKSIZE
+from columnar_store import read_transactions, iter_transaction_chunks
+from feature_pipeline import FeaturePipeline
+from velocity_store import VelocityStore
+from model_registry import publish
+from stage_metrics import METRICS_DIR, StageMetrics, profiled, stage
 
-    if 'dob' in df.columns:
-        df['dob'] = pd.to_datetime(df['dob'], errors='coerce')
-        df['dob_year'] = df['dob'].dt.year
-        df['dob_month'] = df['dob'].dt.month
-        df['dob_day'] = df['dob'].dt.day
-        df = df.drop(columns=['dob'])
+# Boosting rounds are capped at the tuned n_estimators; early stopping can only end training sooner
+MAX_ROUNDS = 200
+EARLY_STOPPING_ROUNDS = 30
 
-    df['trans_date_trans_time'] = pd.to_datetime(df['trans_date_trans_time'], errors='coerce')
-    df['hour'] = df['trans_date_trans_time'].dt.hour
-    df['day'] = df['trans_date_trans_time'].dt.day
-    df['month'] = df['trans_date_trans_time'].dt.month
-    df = df.drop(columns=['trans_date_trans_time'])
+# Booster settings shared by the in-memory and out-of-core trainers (and the benchmark suite)
+MODEL_PARAMS = {'n_estimators': MAX_ROUNDS, 'learning_rate': 0.05, 'max_depth': 8, 'tree_method': 'hist'}
 
-    label_encoders = label_encoders or {}
-    categorical_cols = ['category', 'state', 'job', 'city']
+# Out-of-core mode: share of rows (by trans_num hash) held out for testing and early stopping
+TEST_PERCENT = 20
+VALIDATION_PERCENT = 16
 
-    for col in categorical_cols:
-        le = label_encoders.get(col, LabelEncoder())
-        if col not in label_encoders:
-            df[col] = df[col].astype(str)
-            le.fit(df[col])
-            label_encoders[col] = le
 
-        df[col] = le.transform(df[col].astype(str))
+# Train XGBoost model with SMOTE
+def train_xgboost_with_smote(include_distance=False, data_path="credit_card_fraud.csv", include_velocity=False):
+    with stage("load") as record:
+        df = read_transactions(data_path)  # Original imbalanced dataset
+        record['rows'] = len(df)
 
-    df = df.fillna(0)
-    return df, label_encoders
+    with stage("preprocess"):
+        pipeline = FeaturePipeline(include_distance, include_velocity).fit(df)
+        # Velocity features replay the history through a fresh store
+        velocity_store = VelocityStore() if include_velocity else None
+        X = pipeline.transform_frame(df, velocity_store)
+        y = df['is_fraud']
 
-# Train XGBoost model with SMOTE
-def train_xgboost_with_smote():
-    df = pd.read_csv("credit_card_fraud.csv")  # Original imbalanced dataset
-    df, label_encoders = preprocess_data(df)
-
-    X = df.drop(columns=['is_fraud'])
-    y = df['is_fraud']
-
-    # Apply SMOTE to balance the dataset
-    smote = SMOTE(sampling_strategy='auto', random_state=42)
-    X_resampled, y_resampled = smote.fit_resample(X, y)
-
-    # Train-Test Split
-    X_train, X_test, y_train, y_test = train_test_split(X_resampled, y_resampled, test_size=0.2, random_state=42, stratify=y_resampled)
-
-    # Train XGBoost
-    model = xgb.XGBClassifier(
-        n_estimators=200,
-        learning_rate=0.05,
-        max_depth=8,
-        scale_pos_weight=y_train.value_counts()[0] / y_train.value_counts()[1],
-        random_state=42,
-        eval_metric = 'logloss'
-    )
-    model.fit(X_train, y_train)
+    model, X_test, y_test = fit_xgboost(X, y)
 
-#     # Save model and encoders
-#     joblib.dump(model, "xgboost_model.pkl")
-#     joblib.dump(label_encoders, "label_encoders_xgboost.pkl")
-#
-#
-#     print("✅ XGBoost model training with SMOTE complete!")
-#
-# # Run training
-# if __name__ == "__main__":
-#     train_xgboost_with_smote()
+    # Evaluate the model on the untouched test split (predict uses the best iteration)
+    with stage("evaluate"):
+        y_pred = model.predict(X_test)
+        counts = confusion_matrix(y_test, y_pred, labels=[0, 1]).ravel()
 
-    model.fit(X_train, y_train)
+    metrics = test_metrics(model.best_iteration, counts)
     joblib.dump(model, "xgboost_model.pkl")
-    joblib.dump(label_encoders, "label_encoders_xgboost.pkl")
-    print("✅ XGBoost model training with SMOTE complete!")
+    joblib.dump(pipeline, "label_encoders_xgboost.pkl")
+    if velocity_store is not None:
+        velocity_store.save("velocity_store_xgboost.pkl")
+    version_dir = publish("xgboost", model, pipeline, data_path, metrics, _params(model))
+    print(f"✅ XGBoost model training with SMOTE complete! (registry: {version_dir})")
+    print_report(metrics)
+    return model
+
+
+def fit_xgboost(X, y):
+    # Split, SMOTE-resample and fit with early stopping, exactly as training does (the benchmark
+    # suite calls this too). Returns the model and the untouched test split.
+    with stage("split"):
+        # Hold out real transactions for testing and early stopping before any resampling,
+        # so neither sees synthetic SMOTE rows
+        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42, stratify=y)
+        X_train, X_val, y_train, y_val = train_test_split(X_train, y_train, test_size=0.2, random_state=42,
+                                                          stratify=y_train)
+
+    # Apply SMOTE to balance the training split
+    with stage("resample"):
+        smote = SMOTE(sampling_strategy='auto', random_state=42)
+        X_train, y_train = smote.fit_resample(X_train, y_train)
+
+    # Train XGBoost on histogram bins with all cores; the wrapper quantizes the training
+    # matrix once and bins the validation set with the same cuts
+    with stage("fit"):
+        class_counts = np.bincount(np.asarray(y_train, dtype=np.int64), minlength=2)
+        model = xgb.XGBClassifier(**MODEL_PARAMS, n_jobs=-1, scale_pos_weight=class_counts[0] / class_counts[1],
+                                  random_state=42, eval_metric='logloss',
+                                  early_stopping_rounds=EARLY_STOPPING_ROUNDS)
+        model.fit(X_train, y_train, eval_set=[(X_val, y_val)], verbose=False)
+    return model, X_test, y_test
+
+
+def test_metrics(best_iteration, counts):
+    # Test metrics from confusion counts (tn, fp, fn, tp); also stored in the registry manifest
+    tn, fp, fn, tp = (int(c) for c in counts)
+    precision = tp / (tp + fp) if tp + fp else 0.0
+    recall = tp / (tp + fn) if tp + fn else 0.0
+    return {
+        'rounds': best_iteration + 1,
+        'accuracy': (tp + tn) / max(1, tn + fp + fn + tp),
+        'precision': precision,
+        'recall': recall,
+        'f1': 2 * precision * recall / (precision + recall) if precision + recall else 0.0,
+        'tp': tp, 'tn': tn, 'fp': fp, 'fn': fn,
+    }
+
 
-    # Evaluate the model
-    y_pred = model.predict(X_test)
+def _params(model):
+    return {key: value for key, value in model.get_params().items() if value is not None}
 
 
+def print_report(metrics):
+    # Test metrics and the per-stage timing breakdown
+    print(f"Best iteration: {metrics['rounds']} of {MAX_ROUNDS} rounds")
+    print(f"Accuracy: {metrics['accuracy']:.4f}")
+    print(f"Precision: {metrics['precision']:.4f}")
+    print(f"Recall: {metrics['recall']:.4f}")
+    print(f"F1 Score: {metrics['f1']:.4f}")
+    print(f"XGBoost Confusion Matrix: TP={metrics['tp']}, TN={metrics['tn']}, FP={metrics['fp']}, FN={metrics['fn']}")
+
+
+def _split_buckets(df):
+    # Stable 0-99 bucket per transaction, so every pass over the file splits rows the same way
+    return pd.util.hash_pandas_object(df['trans_num'], index=False).to_numpy() % 100
+
+
+def _split_masks(df):
+    buckets = _split_buckets(df)
+    return {
+        'test': buckets < TEST_PERCENT,
+        'validation': (buckets >= TEST_PERCENT) & (buckets < TEST_PERCENT + VALIDATION_PERCENT),
+        'train': buckets >= TEST_PERCENT + VALIDATION_PERCENT,
+    }
+
+
+def _iter_split_chunks(data_path, pipeline, chunksize, split, velocity_store=None):
+    # (features, labels) of one split, chunk by chunk; velocity features are computed over
+    # every row in file order before the split is taken
+    for chunk in iter_transaction_chunks(data_path, chunksize):
+        X = pipeline.transform(chunk, velocity_store)
+        mask = _split_masks(chunk)[split]
+        yield X[mask], chunk['is_fraud'].to_numpy()[mask]
+
+
+class TransactionChunkIter(xgb.DataIter):
+    # Feeds one split of a transaction file to XGBoost chunk by chunk. XGBoost pages the
+    # quantized chunks to cache_prefix, so only one raw chunk is in memory at a time.
+
+    def __init__(self, data_path, pipeline, chunksize, split, cache_prefix):
+        self.data_path = data_path
+        self.pipeline = pipeline
+        self.chunksize = chunksize
+        self.split = split
+        self.velocity_store = None
+        self._chunks = None
+        super().__init__(cache_prefix=cache_prefix)
+
+    def reset(self):
+        self._chunks = None
+
+    def next(self, input_data):
+        if self._chunks is None:
+            # Every pass replays the history from the start through a fresh velocity store
+            self.velocity_store = VelocityStore() if self.pipeline.include_velocity else None
+            self._chunks = _iter_split_chunks(self.data_path, self.pipeline, self.chunksize, self.split,
+                                              self.velocity_store)
+        for X, y in self._chunks:
+            if len(y):
+                input_data(data=X, label=y)
+                return True
+        return False
+
+
+# Train XGBoost out of core: the file is streamed in chunks and never loaded whole
+def train_xgboost_external_memory(include_distance=False, data_path="credit_card_fraud.csv", include_velocity=False,
+                                  chunksize=DEFAULT_CHUNKSIZE):
+    # First pass: encoder vocabularies and class counts of the training split
+    with stage("preprocess"):
+        pipeline = FeaturePipeline(include_distance, include_velocity)
+        class_counts = np.zeros(2, dtype=np.int64)
+        for chunk in iter_transaction_chunks(data_path, chunksize):
+            pipeline.partial_fit(chunk)
+            labels = chunk['is_fraud'].to_numpy()[_split_masks(chunk)['train']]
+            class_counts += np.bincount(labels.astype(np.int64), minlength=2)[:2]
+
+    cache_dir = tempfile.mkdtemp(prefix="xgboost_cache_")
+    try:
+        # Quantize both splits into on-disk pages; validation reuses the training bin cuts
+        with stage("load"):
+            train_iter = TransactionChunkIter(data_path, pipeline, chunksize, 'train', f"{cache_dir}/train")
+            dtrain = xgb.ExtMemQuantileDMatrix(train_iter)
+            dval = xgb.ExtMemQuantileDMatrix(
+                TransactionChunkIter(data_path, pipeline, chunksize, 'validation', f"{cache_dir}/validation"),
+                ref=dtrain)
+
+        # Class weighting replaces SMOTE, so the data is never resampled or duplicated
+        with stage("fit"):
+            params = {
+                'objective': 'binary:logistic',
+                'eval_metric': 'logloss',
+                'tree_method': MODEL_PARAMS['tree_method'],
+                'learning_rate': MODEL_PARAMS['learning_rate'],
+                'max_depth': MODEL_PARAMS['max_depth'],
+                'scale_pos_weight': class_counts[0] / max(1, class_counts[1]),
+                'seed': 42,
+            }
+            booster = xgb.train(params, dtrain, num_boost_round=MAX_ROUNDS, evals=[(dval, 'validation')],
+                                early_stopping_rounds=EARLY_STOPPING_ROUNDS, verbose_eval=False)
+        del dtrain, dval  # their destructors remove the cache pages
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    # Same estimator type the in-memory trainer saves, so every scoring path can load it
+    model = xgb.XGBClassifier()
+    model.load_model(booster.save_raw('json'))
+
+    with stage("evaluate"):
+        counts = np.zeros(4, dtype=np.int64)
+        for X, y in _iter_split_chunks(data_path, pipeline, chunksize, 'test',
+                                       VelocityStore() if include_velocity else None):
+            counts += confusion_matrix(y, model.predict(X), labels=[0, 1]).ravel()
+
+    metrics = test_metrics(model.best_iteration, counts)
+    joblib.dump(model, "xgboost_model.pkl")
+    joblib.dump(pipeline, "label_encoders_xgboost.pkl")
+    if train_iter.velocity_store is not None:
+        train_iter.velocity_store.save("velocity_store_xgboost.pkl")
+    version_dir = publish("xgboost", model, pipeline, data_path, metrics, params)
+    print(f"✅ XGBoost out-of-core training complete! (registry: {version_dir})")
+    print_report(metrics)
+    return model
+
 
 # Run training
 if __name__ == "__main__":
-    train_xgboost_with_smote()
+    parser = argparse.ArgumentParser(description="Train the XGBoost model with SMOTE")
+    parser.add_argument("--distance", action="store_true", help="Add customer-merchant distance as a feature")
+    parser.add_argument("--data", default="credit_card_fraud.csv", help="CSV, Parquet or Arrow training data")
+    parser.add_argument("--velocity", action="store_true", help="Add per-customer 1h/24h/7d velocity features")
+    parser.add_argument("--external-memory", action="store_true",
+                        help="Stream the data from disk with class weighting instead of SMOTE")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE, help="Rows per chunk in --external-memory mode")
+    parser.add_argument("--metrics-dir", default=METRICS_DIR, help="Where the JSON log and Prometheus file go")
+    parser.add_argument("--profile", default=None, help="Also run under cProfile and save the stats to this file")
+    args = parser.parse_args()
+    with StageMetrics("train_xgboost") as run, profiled(args.profile):
+        if args.external_memory:
+            train_xgboost_external_memory(args.distance, args.data, args.velocity, args.chunksize)
+        else:
+            train_xgboost_with_smote(args.distance, args.data, args.velocity)
+    run.print_report()
+    print(f"✅ Stage metrics saved to {run.save(args.metrics_dir)}")
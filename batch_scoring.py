@@ -0,0 +1,268 @@
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from columnar_store import ARROW_EXTENSIONS, arrow_schema, is_columnar, iter_transaction_chunks
+from feature_pipeline import load_pipeline
+from prediction_cache import predict_cached
+from stage_metrics import StageMetrics, current_run, stage, timed_iter
+
+# Rows read, scored and written per chunk in streaming mode
+DEFAULT_CHUNKSIZE = 100_000
+
+# Upper bound on the size of one byte-range partition in parallel mode
+MAX_PARTITION_BYTES = 64 * 1024 * 1024
+
+# Columns of the compact output written to Parquet/Arrow outputs: label is 1 for fraud, 0 otherwise
+COMPACT_COLUMNS = ['trans_num', 'score', 'label', 'model_version']
+
+# 'prediction' values of the full CSV output
+FRAUD_LABEL = "Fraud Transaction"
+NORMAL_LABEL = "Normal Transaction"
+
+# Per-process model state, filled once by _init_worker
+_worker = {}
+
+
+def predict_frame(df, pipeline, score_fn, velocity_store=None, cache=None, cache_key=None):
+    # score_fn(features) returns (scores, is_fraud) for the rows of df. With a PredictionCache, only
+    # rows whose (cache_key, trans_num) isn't cached are preprocessed and scored.
+    if cache is not None and velocity_store is not None:
+        # Cache hits skip transform_frame, so their transactions would never reach the velocity store
+        raise ValueError("pipelines with velocity features can't use the prediction cache; score without --cache")
+
+    def predict(frame):
+        with stage("preprocess", len(frame)):
+            features = pipeline.transform_frame(frame, velocity_store)
+        with stage("predict", len(frame)):
+            return score_fn(features)
+    return predict_cached(df, predict, cache, cache_key)
+
+
+def score_frame(df, pipeline, score_fn, velocity_store=None, cache=None, cache_key=None):
+    # Score one frame and return the transactions with 'score' and 'prediction' columns
+    scores, is_fraud = predict_frame(df, pipeline, score_fn, velocity_store, cache, cache_key)
+    return label_frame(df, scores, is_fraud)
+
+
+def label_frame(df, scores, is_fraud):
+    # Label strings are only built here, for the full CSV output
+    with stage("label", len(df)):
+        df = df.drop(columns=['is_fraud'], errors='ignore')
+        df['score'] = scores
+        df['prediction'] = np.where(is_fraud, FRAUD_LABEL, NORMAL_LABEL)
+    return df
+
+
+def compact_table(trans_num, scores, is_fraud, model_version, flagged_only=False):
+    # Arrow table of COMPACT_COLUMNS; flagged_only keeps just the rows flagged as fraud.
+    # scores may also be {column: values} for several score columns (NaN is written as null).
+    import pyarrow as pa  # only needed for compact output
+    scores = scores if isinstance(scores, dict) else {'score': scores}
+    is_fraud = np.asarray(is_fraud, dtype=bool)
+    keep = is_fraud if flagged_only else slice(None)
+    trans_num = np.asarray(trans_num, dtype=object)[keep]
+    return pa.table([
+        pa.array(trans_num, pa.string()),
+        *(pa.array(np.asarray(values, dtype=np.float32)[keep], from_pandas=True) for values in scores.values()),
+        pa.array(is_fraud[keep].astype(np.int8)),
+        pa.DictionaryArray.from_arrays(pa.array(np.zeros(len(trans_num), dtype=np.int32)), [model_version]),
+    ], schema=arrow_schema(['trans_num', *scores, 'label', 'model_version']))
+
+
+class PredictionWriter:
+    # Appends compact prediction batches to a Parquet or Arrow IPC file as they are scored,
+    # so nothing but trans_num, score(s), label and model version is ever written
+
+    def __init__(self, path, model_version, flagged_only=False, columns=COMPACT_COLUMNS):
+        import pyarrow.ipc as ipc
+        import pyarrow.parquet as pq
+        self.model_version = model_version
+        self.flagged_only = flagged_only
+        self.rows = 0
+        schema = arrow_schema(columns)
+        if str(path).lower().endswith(ARROW_EXTENSIONS):
+            self._writer = ipc.new_file(path, schema)
+        else:
+            self._writer = pq.ParquetWriter(path, schema)
+
+    def write(self, df, scores, is_fraud):
+        self.write_table(compact_table(df['trans_num'], scores, is_fraud, self.model_version, self.flagged_only))
+
+    def write_table(self, table):
+        if table.num_rows:
+            self._writer.write_table(table)
+            self.rows += table.num_rows
+
+    def close(self):
+        self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def write_compact(path, df, scores, is_fraud, model_version, flagged_only=False, columns=COMPACT_COLUMNS):
+    # One-shot compact output for an already scored frame; returns the rows written
+    with stage("write", len(df)), PredictionWriter(path, model_version, flagged_only, columns) as writer:
+        writer.write(df, scores, is_fraud)
+    return writer.rows
+
+
+def score_csv_streaming(input_path, output_path, pipeline, score_fn, chunksize=DEFAULT_CHUNKSIZE,
+                        velocity_store=None, model_version=None, flagged_only=False, cache=None, cache_key=None):
+    # Read, score and append one chunk at a time so memory stays bounded by chunksize.
+    # Parquet/Arrow outputs get the compact columns, appended batch by batch.
+    total_rows = 0
+    writer = PredictionWriter(output_path, model_version, flagged_only) if is_columnar(output_path) else None
+    try:
+        for i, chunk in enumerate(timed_iter("read", iter_transaction_chunks(input_path, chunksize))):
+            if writer is not None:
+                scores, is_fraud = predict_frame(chunk, pipeline, score_fn, velocity_store, cache, cache_key)
+                with stage("write", len(chunk)):
+                    writer.write(chunk, scores, is_fraud)
+            else:
+                scored = score_frame(chunk, pipeline, score_fn, velocity_store, cache, cache_key)
+                if flagged_only:
+                    scored = scored[scored['prediction'].to_numpy() == FRAUD_LABEL]
+                with stage("write", len(scored)):
+                    scored.to_csv(output_path, mode='w' if i == 0 else 'a', header=(i == 0), index=False)
+            total_rows += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    return total_rows
+
+
+def _check_stateless(pipeline_path):
+    # Velocity features need one shared, time-ordered VelocityStore, which workers can't share
+    if load_pipeline(pipeline_path).include_velocity:
+        raise ValueError("pipelines with velocity features can't be scored in parallel; use chunked mode")
+
+
+def _init_worker(model_path, pipeline_path, score_transactions, load_model):
+    # Load model and encoders once per process; keep each worker single-threaded
+    model = load_model(model_path)
+    if hasattr(model, 'get_booster'):
+        model.get_booster().set_param({'nthread': 1})
+    elif hasattr(model, 'n_jobs'):
+        model.n_jobs = 1
+    _worker['pipeline'] = load_pipeline(pipeline_path)
+    _worker['score_fn'] = partial(score_transactions, model)
+
+
+def _byte_partitions(path, workers):
+    # Split the file body into line-aligned byte ranges; the header is shared by all of them
+    with open(path, 'rb') as f:
+        header = f.readline()
+        data_start = f.tell()
+        size = os.fstat(f.fileno()).st_size
+        partition_bytes = min(MAX_PARTITION_BYTES, max(1, (size - data_start) // (workers * 4)))
+
+        bounds = [data_start]
+        pos = data_start
+        while pos + partition_bytes < size:
+            f.seek(pos + partition_bytes)
+            f.readline()  # move to the start of the next line
+            pos = f.tell()
+            if pos >= size:
+                break
+            bounds.append(pos)
+        bounds.append(size)
+    return header, list(zip(bounds[:-1], bounds[1:]))
+
+
+def _score_byte_range(path, header, start, end, compact, model_version, flagged_only):
+    # Returns this partition's output (a compact Arrow table or the scored frame), its input
+    # row count and its stage metrics, merged by the parent
+    with StageMetrics("worker") as run:
+        with run.stage("read") as record:
+            with open(path, 'rb') as f:
+                f.seek(start)
+                data = f.read(end - start)
+            df = pd.read_csv(io.BytesIO(header + data))
+            record['rows'] = len(df)
+        if compact:
+            scores, is_fraud = predict_frame(df, _worker['pipeline'], _worker['score_fn'])
+            out = compact_table(df['trans_num'], scores, is_fraud, model_version, flagged_only)
+        else:
+            out = score_frame(df, _worker['pipeline'], _worker['score_fn'])
+            if flagged_only:
+                out = out[out['prediction'].to_numpy() == FRAUD_LABEL]
+    return out, len(df), run.stages
+
+
+def _predict_rows(df):
+    with StageMetrics("worker") as run:
+        scores, is_fraud = predict_frame(df, _worker['pipeline'], _worker['score_fn'])
+    return scores, is_fraud, run.stages
+
+
+def _merge_worker_stages(stages):
+    # Worker stages are listed under "workers/"; their seconds add up across processes
+    run = current_run()
+    if run is not None:
+        run.merge(stages, prefix="workers")
+
+
+def score_csv_parallel(input_path, output_path, model_path, pipeline_path, score_transactions, workers=None,
+                       load_model=joblib.load, model_version=None, flagged_only=False):
+    # Score byte-range partitions in a process pool and write them back in file order;
+    # Parquet/Arrow outputs get the compact columns
+    if is_columnar(input_path):
+        raise ValueError("parallel scoring splits CSV byte ranges; use chunked mode for columnar files")
+    _check_stateless(pipeline_path)
+    workers = workers or os.cpu_count()
+    header, partitions = _byte_partitions(input_path, workers)
+    if not partitions:
+        return 0
+
+    total_rows = 0
+    compact = is_columnar(output_path)
+    writer = PredictionWriter(output_path, model_version, flagged_only) if compact else None
+    n = len(partitions)
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(model_path, pipeline_path, score_transactions, load_model)) as pool:
+            starts, ends = zip(*partitions)
+            results = pool.map(_score_byte_range, [input_path] * n, [header] * n, starts, ends, [compact] * n,
+                               [model_version] * n, [flagged_only] * n)
+            for i, (out, rows, stages) in enumerate(results):  # map yields in submission order
+                _merge_worker_stages(stages)
+                with stage("write", len(out)):
+                    if writer is not None:
+                        writer.write_table(out)
+                    else:
+                        out.to_csv(output_path, mode='w' if i == 0 else 'a', header=(i == 0), index=False)
+                total_rows += rows
+    finally:
+        if writer is not None:
+            writer.close()
+    return total_rows
+
+
+def score_frame_parallel(df, model_path, pipeline_path, score_transactions, workers=None,
+                         load_model=joblib.load, cache=None, cache_key=None):
+    # Same as score_frame, but split into row ranges scored by a process pool; the prediction
+    # cache is checked here, so only the rows it misses are sent to the workers
+    _check_stateless(pipeline_path)
+    workers = workers or os.cpu_count()
+
+    def predict(frame):
+        parts = [frame.iloc[idx] for idx in np.array_split(np.arange(len(frame)), workers) if len(idx)]
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(model_path, pipeline_path, score_transactions, load_model)) as pool:
+            results = list(pool.map(_predict_rows, parts))
+        for *_, stages in results:
+            _merge_worker_stages(stages)
+        return np.concatenate([r[0] for r in results]), np.concatenate([r[1] for r in results])
+
+    scores, is_fraud = predict_cached(df, predict, cache, cache_key)
+    return label_frame(df, scores, is_fraud)
@@ -0,0 +1,247 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import numpy as np
+import pandas as pd
+
+from stage_metrics import peak_rss_mb
+
+# Dataset sizes the suite knows about; pick a subset with --scales
+SCALES = {'10k': 10_000, '100k': 100_000, '1M': 1_000_000, '10M': 10_000_000}
+
+# Cached datasets, features and fitted models, one directory per scale
+DATA_DIR = "bench_data"
+
+# A benchmark is slower than the baseline when seconds / baseline_seconds exceeds 1 + threshold
+DEFAULT_THRESHOLD = 0.10
+
+# Noise floor: growth smaller than this is never a regression, whatever the ratio (short runs jitter by
+# milliseconds, and peak RSS by an allocator arena or two)
+NOISE_FLOOR = {'seconds': 0.05, 'peak_rss_mb': 32.0}
+
+# Timed runs per benchmark; the median is compared, so one slow run doesn't fail the suite
+DEFAULT_REPEAT = 5
+
+# Single transactions scored one at a time by the single-row benchmarks
+SINGLE_ROWS = 200
+
+def _path(scale_dir, name):
+    return os.path.join(scale_dir, name)
+
+
+# Each benchmark: setup(scale_dir) -> inputs (untimed), run(inputs) -> result (timed), and an
+# optional save(scale_dir, result). They run in order and later ones read what earlier ones saved.
+
+def _setup_preprocess(scale_dir):
+    return pd.read_parquet(_path(scale_dir, "transactions.parquet"))
+
+
+def _run_preprocess(df):
+    from feature_pipeline import FeaturePipeline
+    pipeline = FeaturePipeline()
+    return pipeline, pipeline.fit_transform(df), df['is_fraud'].to_numpy(dtype=np.int8)
+
+
+def _save_preprocess(scale_dir, result):
+    import joblib
+    pipeline, X, y = result
+    np.save(_path(scale_dir, "X.npy"), X)
+    np.save(_path(scale_dir, "y.npy"), y)
+    joblib.dump(pipeline, _path(scale_dir, "pipeline.pkl"))
+
+
+def _load_features(scale_dir):
+    return np.load(_path(scale_dir, "X.npy")), np.load(_path(scale_dir, "y.npy"))
+
+
+# Fits call the trainers' own functions, so a change to their settings shows up here
+
+def _run_fit_isolation_forest(inputs):
+    from isolate_forest import fit_isolation_forest
+    X, _ = inputs
+    return fit_isolation_forest(X)
+
+
+def _run_fit_xgboost(inputs):
+    # Split, SMOTE and early stopping included, as in XGBoost.py
+    from XGBoost import fit_xgboost
+    X, y = inputs
+    return fit_xgboost(X, y)[0]
+
+
+def _saver(filename):
+    def save(scale_dir, model):
+        import joblib
+        joblib.dump(model, _path(scale_dir, filename))
+    return save
+
+
+def _model_loader(filename, load_model):
+    def setup(scale_dir):
+        return load_model(_path(scale_dir, filename)), _load_features(scale_dir)[0]
+    return setup
+
+
+def _load_forest(path):
+    from compiled_forest import load_isolation_forest  # scored the way the scripts load it
+    return load_isolation_forest(path)
+
+
+def _load_xgboost(path):
+    import joblib
+    return joblib.load(path)
+
+
+def _run_batch(score_fn):
+    def run(inputs):
+        model, X = inputs
+        score_fn(model, X)
+    return run
+
+
+def _single_row_loader(filename, load_model):
+    def setup(scale_dir):
+        import joblib
+        model = load_model(_path(scale_dir, filename))
+        pipeline = joblib.load(_path(scale_dir, "pipeline.pkl"))
+        df = pd.read_parquet(_path(scale_dir, "transactions.parquet")).head(SINGLE_ROWS)
+        return model, pipeline, [df.iloc[[i]] for i in range(len(df))]
+    return setup
+
+
+def _run_single_rows(score_fn):
+    def run(inputs):
+        # End to end for one transaction at a time: preprocessing plus scoring, as the service does
+        model, pipeline, rows = inputs
+        for row in rows:
+            score_fn(model, pipeline.transform(row))
+    return run
+
+
+def _score_isolation_forest(model, X):
+    from detect_fraud_isolate import score_transactions
+    return score_transactions(model, X)
+
+
+def _score_xgboost(model, X):
+    from detect_fraud_xgboost import score_transactions
+    return score_transactions(model, X)
+
+
+# name -> (setup, run, save or None, rows per run as a function of the scale's row count)
+BENCHMARKS = {
+    'preprocess': (_setup_preprocess, _run_preprocess, _save_preprocess, lambda n: n),
+    'fit_isolation_forest': (_load_features, _run_fit_isolation_forest, _saver("isolation_forest.pkl"),
+                             lambda n: n),
+    'fit_xgboost': (_load_features, _run_fit_xgboost, _saver("xgboost.pkl"), lambda n: n),
+    'batch_predict_isolation_forest': (_model_loader("isolation_forest.pkl", _load_forest),
+                                       _run_batch(_score_isolation_forest), None, lambda n: n),
+    'batch_predict_xgboost': (_model_loader("xgboost.pkl", _load_xgboost), _run_batch(_score_xgboost), None,
+                              lambda n: n),
+    'single_row_predict_isolation_forest': (_single_row_loader("isolation_forest.pkl", _load_forest),
+                                            _run_single_rows(_score_isolation_forest), None,
+                                            lambda n: min(n, SINGLE_ROWS)),
+    'single_row_predict_xgboost': (_single_row_loader("xgboost.pkl", _load_xgboost),
+                                   _run_single_rows(_score_xgboost), None, lambda n: min(n, SINGLE_ROWS)),
+}
+
+
+def _run_one(name, scale_dir, rows, repeat):
+    # Runs in a fresh process, so the peak RSS belongs to this benchmark alone
+    setup, run, save, rows_per_run = BENCHMARKS[name]
+    inputs = setup(scale_dir)
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = run(inputs)
+        timings.append(time.perf_counter() - start)
+    if save is not None:
+        save(scale_dir, result)
+    seconds = float(np.median(timings))
+    return {
+        'seconds': seconds,
+        'min_seconds': min(timings),
+        'rows_per_sec': rows_per_run(rows) / seconds if seconds else None,
+        'peak_rss_mb': peak_rss_mb(),  # None where the resource module is missing
+    }
+
+
+def run_suite(scales, benchmarks=None, repeat=DEFAULT_REPEAT, seed=0, data_dir=DATA_DIR):
+    # Every benchmark gets its own spawned process; datasets are generated once per scale and seed
+    results = {}
+    context = get_context("spawn")
+    for scale in scales:
+        rows = SCALES[scale]
+        scale_dir = os.path.join(data_dir, f"{scale}-seed{seed}")
+        if not os.path.exists(_path(scale_dir, "transactions.parquet")):
+            from fake_transactions import FRAUD_PATTERNS, write_transactions  # kept out of the benchmark processes
+            # Seeded, with fraud patterns, so the models have something to find and reruns see the same rows
+            os.makedirs(scale_dir, exist_ok=True)
+            write_transactions(_path(scale_dir, "transactions.parquet"), rows, seed, fraud_patterns=FRAUD_PATTERNS)
+        for name in benchmarks or BENCHMARKS:
+            with ProcessPoolExecutor(1, mp_context=context) as pool:
+                results[f"{name}@{scale}"] = result = pool.submit(_run_one, name, scale_dir, rows, repeat).result()
+            rate = f"{result['rows_per_sec']:,.0f} rows/s" if result['rows_per_sec'] else ""
+            rss = f"  peak RSS {result['peak_rss_mb']:.0f} MB" if result['peak_rss_mb'] is not None else ""
+            print(f"⏱ {name}@{scale}: {result['seconds']:.3f}s  {rate}{rss}")
+    return {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'repeat': repeat,
+        'results': results,
+    }
+
+
+def compare(report, baseline, threshold=DEFAULT_THRESHOLD):
+    # Benchmarks whose median time or peak RSS grew by more than threshold relative to the baseline,
+    # and by more than the metric's NOISE_FLOOR
+    regressions = []
+    for key, result in report['results'].items():
+        base = baseline['results'].get(key)
+        if base is None:
+            continue
+        for metric in ('seconds', 'peak_rss_mb'):
+            if result.get(metric) is None or base.get(metric) is None:
+                continue  # RSS is not recorded where the resource module is missing
+            ratio = result[metric] / base[metric] if base[metric] else 1.0
+            regressed = ratio > 1 + threshold and result[metric] - base[metric] > NOISE_FLOOR[metric]
+            status = "❌ regression" if regressed else "✅"
+            print(f"{key:<45}{metric:<13}{base[metric]:>12.3f} -> {result[metric]:>12.3f}  x{ratio:.2f}  {status}")
+            if regressed:
+                regressions.append((key, metric, ratio))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark preprocessing, training and scoring")
+    parser.add_argument("--scales", default="10k,100k", help=f"Comma-separated subset of {', '.join(SCALES)}")
+    parser.add_argument("--benchmarks", default=None, help="Comma-separated subset of the benchmarks (default: all)")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT,
+                        help="Timed runs per benchmark; the median is kept and compared")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", default=None, help="Earlier results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Allowed slowdown or memory growth, as a fraction of the baseline")
+    args = parser.parse_args()
+
+    report = run_suite(args.scales.split(","), args.benchmarks.split(",") if args.benchmarks else None,
+                       args.repeat, args.seed)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"✅ Results saved to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        if regressions:
+            print(f"❌ {len(regressions)} regression(s) above {args.threshold:.0%}")
+            sys.exit(1)
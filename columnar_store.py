@@ -0,0 +1,161 @@
+import argparse
+import os
+
+import pandas as pd
+
+# Typed schema for transaction files; 'dictionary' columns load as pandas categoricals
+COLUMN_TYPES = {
+    'trans_date_trans_time': 'timestamp',
+    'merchant': 'string',
+    'category': 'dictionary',
+    'amt': 'float32',
+    'city': 'dictionary',
+    'state': 'dictionary',
+    'lat': 'float32',
+    'long': 'float32',
+    'city_pop': 'int32',
+    'job': 'dictionary',
+    'dob': 'date32',
+    'trans_num': 'string',
+    'merch_lat': 'float32',
+    'merch_long': 'float32',
+    'is_fraud': 'int8',
+    'prediction': 'dictionary',
+    # Compact prediction output (batch_scoring.PredictionWriter)
+    'score': 'float32',
+    'label': 'int8',
+    'model_version': 'dictionary',
+    # Ensemble output (detect_fraud_ensemble.py): one score per model, null where the cascade skipped it
+    'isolation_forest_score': 'float32',
+    'xgboost_score': 'float32',
+}
+
+# Extensions handled by the columnar reader; anything else is read as CSV
+PARQUET_EXTENSIONS = ('.parquet', '.pq')
+ARROW_EXTENSIONS = ('.arrow', '.feather', '.ipc')
+
+# Bytes of CSV parsed per record batch during conversion
+DEFAULT_BLOCK_SIZE = 64 * 1024 * 1024
+
+
+def is_columnar(path):
+    return str(path).lower().endswith(PARQUET_EXTENSIONS + ARROW_EXTENSIONS)
+
+
+def _arrow_type(name):
+    import pyarrow as pa  # pyarrow is only needed for columnar files
+    return {
+        'timestamp': pa.timestamp('s'),
+        'string': pa.string(),
+        'dictionary': pa.string(),  # read as string, dictionary-encoded batch by batch
+        'float32': pa.float32(),
+        'int32': pa.int32(),
+        'int8': pa.int8(),
+        'date32': pa.date32(),
+    }[name]
+
+
+def arrow_schema(columns):
+    # Typed schema for these transaction columns, with 'dictionary' columns dictionary-encoded
+    import pyarrow as pa
+    return pa.schema([pa.field(col, pa.dictionary(pa.int32(), pa.string()) if COLUMN_TYPES[col] == 'dictionary'
+                               else _arrow_type(COLUMN_TYPES[col])) for col in columns])
+
+
+class _DictionaryEncoder:
+    # Keeps one growing dictionary per column so every batch extends the previous
+    # one; Arrow IPC files only accept dictionary deltas, not replacements
+
+    def __init__(self):
+        self.values = {}
+
+    def encode(self, col, array):
+        import pyarrow as pa
+        values = array.to_pandas()
+        known = self.values.get(col, pd.Index([], dtype=object))
+        codes = known.get_indexer(values)
+        new = pd.unique(values[(codes < 0) & values.notna().to_numpy()])
+        if len(new):
+            known = known.append(pd.Index(new, dtype=object))
+            codes = known.get_indexer(values)
+        self.values[col] = known
+        return pa.DictionaryArray.from_arrays(pa.array(codes, pa.int32(), mask=codes < 0),
+                                              pa.array(known, pa.string()))
+
+
+def convert_csv(csv_path, out_path, block_size=DEFAULT_BLOCK_SIZE):
+    # Stream a transaction CSV into Parquet or Arrow IPC with the typed schema
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.ipc as ipc
+    import pyarrow.parquet as pq
+
+    column_types = {col: _arrow_type(name) for col, name in COLUMN_TYPES.items()}
+    reader = pa_csv.open_csv(csv_path, read_options=pa_csv.ReadOptions(block_size=block_size),
+                             convert_options=pa_csv.ConvertOptions(column_types=column_types))
+
+    fields = []
+    for field in reader.schema:
+        if COLUMN_TYPES.get(field.name) == 'dictionary':
+            field = pa.field(field.name, pa.dictionary(pa.int32(), pa.string()))
+        fields.append(field)
+    schema = pa.schema(fields)
+
+    if str(out_path).lower().endswith(PARQUET_EXTENSIONS):
+        writer = pq.ParquetWriter(out_path, schema)
+    else:
+        writer = ipc.new_file(out_path, schema, options=ipc.IpcWriteOptions(emit_dictionary_deltas=True))
+
+    encoder = _DictionaryEncoder()
+    rows = 0
+    with writer:
+        for batch in reader:
+            columns = [encoder.encode(field.name, batch.column(i)) if pa.types.is_dictionary(field.type)
+                       else batch.column(i) for i, field in enumerate(schema)]
+            writer.write_batch(pa.record_batch(columns, schema=schema))
+            rows += batch.num_rows
+    return rows
+
+
+def read_table(path, columns=None, memory_map=True):
+    # Arrow table with optional column projection; memory-mapped reads avoid copying the file
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+    import pyarrow.parquet as pq
+
+    if str(path).lower().endswith(PARQUET_EXTENSIONS):
+        return pq.read_table(path, columns=columns, memory_map=memory_map)
+    source = pa.memory_map(path) if memory_map else pa.OSFile(path)
+    table = ipc.open_file(source).read_all()
+    return table.select(columns) if columns is not None else table
+
+
+def read_transactions(path, columns=None, memory_map=True):
+    # Load transactions from CSV or a columnar file; columnar files keep their typed schema
+    # (categoricals, float32 coordinates, int32 city_pop, native timestamps)
+    if not is_columnar(path):
+        return pd.read_csv(path, usecols=columns)
+    return read_table(path, columns, memory_map).to_pandas(date_as_object=False)
+
+
+def iter_transaction_chunks(path, chunksize):
+    # Yield DataFrames of about chunksize rows from CSV or a columnar file
+    if not is_columnar(path):
+        yield from pd.read_csv(path, chunksize=chunksize)
+        return
+    import pyarrow.parquet as pq
+    if str(path).lower().endswith(PARQUET_EXTENSIONS):
+        batches = pq.ParquetFile(path, memory_map=True).iter_batches(batch_size=chunksize)
+    else:
+        batches = read_table(path).to_batches(max_chunksize=chunksize)
+    for batch in batches:
+        yield batch.to_pandas(date_as_object=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert a transaction CSV to Parquet or Arrow IPC")
+    parser.add_argument("input", help="CSV file, e.g. credit_card_fraud.csv")
+    parser.add_argument("output", help="Output file ending in .parquet, .arrow or .feather")
+    args = parser.parse_args()
+    rows = convert_csv(args.input, args.output)
+    print(f"✅ Converted {rows} rows ({os.path.getsize(args.output) / 1e6:.1f} MB) into {args.output}")
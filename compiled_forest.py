@@ -0,0 +1,163 @@
+import joblib
+import numpy as np
+
+# Upper bound on rows x trees traversed at once, so big batches don't allocate huge index matrices
+MAX_TRAVERSAL_CELLS = 1 << 18
+
+# From about this many rows sklearn's compiled per-tree loop is faster than the flat walk
+# (its ~0.1 ms per tree overhead is amortized), so bigger batches are handed to the model
+LARGE_BATCH_ROWS = 1024
+
+# Node arrays written by save_arrays; everything else fits in a small dict of scalars
+ARRAY_NAMES = ['feature', 'threshold', 'children', 'leaf_value', 'roots']
+
+
+def _average_path_length(n_samples):
+    # Expected path length of an unsuccessful search in a BST of n_samples (same formula as sklearn)
+    n_samples = np.asarray(n_samples, dtype=np.float64)
+    lengths = np.zeros_like(n_samples)
+    lengths[n_samples == 2] = 1.0
+    large = n_samples > 2
+    lengths[large] = (2.0 * (np.log(n_samples[large] - 1.0) + np.euler_gamma)
+                      - 2.0 * (n_samples[large] - 1.0) / n_samples[large])
+    return lengths
+
+
+def _path_lengths(children_left, children_right):
+    # Number of nodes from the root down to every node (the root counts as 1)
+    lengths = np.zeros(len(children_left), dtype=np.int64)
+    lengths[0] = 1
+    for node in range(len(children_left)):  # sklearn numbers children after their parent
+        if children_left[node] >= 0:
+            lengths[children_left[node]] = lengths[children_right[node]] = lengths[node] + 1
+    return lengths
+
+
+def _round_down_float32(thresholds):
+    # Largest float32 <= each threshold: for float32 inputs, x <= t32 exactly when x <= t
+    rounded = thresholds.astype(np.float32)
+    too_big = rounded > thresholds
+    rounded[too_big] = np.nextafter(rounded[too_big], np.float32(-np.inf))
+    return rounded
+
+
+class CompiledIsolationForest:
+    # A fitted IsolationForest packed into flat node arrays. Every tree's nodes sit in
+    # one contiguous block; leaves point to themselves, so all trees are walked together
+    # for a whole batch in max_depth vectorized steps instead of one Python call per tree.
+
+    def __init__(self, model):
+        n_features = model.n_features_in_
+        feature, threshold, left, right, leaf_value, roots = [], [], [], [], [], []
+        offset = 0
+        for tree, features in zip(model.estimators_, model.estimators_features_):
+            t = tree.tree_
+            nodes = np.arange(t.node_count)
+            is_leaf = t.children_left < 0
+            # Trees fit on a feature subsample index into that subsample, not into X
+            tree_features = np.asarray(features)[t.feature] if len(features) != n_features else t.feature
+
+            roots.append(offset)
+            feature.append(np.where(is_leaf, 0, tree_features))
+            threshold.append(np.where(is_leaf, np.inf, t.threshold))
+            left.append(offset + np.where(is_leaf, nodes, t.children_left))
+            right.append(offset + np.where(is_leaf, nodes, t.children_right))
+            # Same per-leaf term sklearn adds up: path length + expected rest of the path - 1
+            leaf_value.append(_path_lengths(t.children_left, t.children_right)
+                              + _average_path_length(t.n_node_samples) - 1.0)
+            offset += t.node_count
+
+        self.feature = np.concatenate(feature).astype(np.int32)
+        self.threshold = _round_down_float32(np.concatenate(threshold))
+        # children[2 * node + went_left] is the next node: one gather per step instead of two
+        self.children = np.column_stack([np.concatenate(right), np.concatenate(left)]).astype(np.int32).ravel()
+        self.leaf_value = np.concatenate(leaf_value)
+        self.roots = np.asarray(roots, dtype=np.int32)
+        self.max_depth = max(tree.tree_.max_depth for tree in model.estimators_)
+        self.denominator = len(model.estimators_) * _average_path_length([model.max_samples_])[0]
+        self.offset_ = model.offset_
+        self.model = model
+        self.n_features_in_ = n_features
+        self.feature_names_in_ = getattr(model, 'feature_names_in_', None)
+
+    @classmethod
+    def from_arrays(cls, arrays, info):
+        # Rebuild from save_arrays output; the arrays may be read-only memory maps shared
+        # by several processes. Without the sklearn model every batch uses the flat walk.
+        forest = cls.__new__(cls)
+        for name in ARRAY_NAMES:
+            setattr(forest, name, arrays[name])
+        forest.max_depth = info['max_depth']
+        forest.denominator = info['denominator']
+        forest.offset_ = info['offset']
+        forest.n_features_in_ = info['n_features_in']
+        forest.feature_names_in_ = np.array(info['feature_names'], dtype=object) if info['feature_names'] else None
+        forest.model = None
+        return forest
+
+    def save_arrays(self, directory):
+        # One .npy per node array (np.load(..., mmap_mode='r') maps them back) plus the scalars
+        for name in ARRAY_NAMES:
+            np.save(f"{directory}/{name}.npy", getattr(self, name))
+        return {
+            'max_depth': int(self.max_depth),
+            'denominator': float(self.denominator),
+            'offset': float(self.offset_),
+            'n_features_in': int(self.n_features_in_),
+            'feature_names': None if self.feature_names_in_ is None else [str(f) for f in self.feature_names_in_],
+        }
+
+    def _check_features(self, X):
+        if self.feature_names_in_ is not None and hasattr(X, 'columns'):
+            if list(X.columns) != list(self.feature_names_in_):
+                raise ValueError("feature names don't match the ones the forest was fitted with")
+        X = np.ascontiguousarray(X, dtype=np.float32)  # sklearn also scores in float32
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            raise ValueError(f"expected {self.n_features_in_} features, got {X.shape[-1]}")
+        return X
+
+    def _depths(self, X):
+        # Walk every row down every tree; row offsets turn (row, feature) into a flat index
+        n_rows, n_features = X.shape
+        flat = X.ravel()
+        row_offsets = np.arange(n_rows, dtype=np.int32) * n_features
+        nodes = np.repeat(self.roots[:, None], n_rows, axis=1)
+        for _ in range(self.max_depth):
+            go_left = flat[row_offsets + self.feature[nodes]] <= self.threshold[nodes]
+            nodes = self.children[2 * nodes + go_left]
+        # cumsum adds the trees one after another, exactly as sklearn accumulates them
+        return np.cumsum(self.leaf_value[nodes], axis=0)[-1]
+
+    def score_samples(self, X):
+        X = self._check_features(X)
+        if not len(X):
+            return np.zeros(0)
+        step = max(1, MAX_TRAVERSAL_CELLS // len(self.roots))
+        depths = np.concatenate([self._depths(X[start:start + step]) for start in range(0, len(X), step)])
+        if self.denominator == 0:
+            return np.full_like(depths, -0.5)  # a forest fit on a single sample, as in sklearn
+        return -(2 ** -(depths / self.denominator))
+
+    def decision_function(self, X):
+        # Same values as IsolationForest.decision_function: negative means anomaly
+        if self.model is not None and len(X) >= LARGE_BATCH_ROWS:
+            return self.model.decision_function(X)
+        return self.score_samples(X) - self.offset_
+
+    def predict(self, X):
+        return np.where(self.decision_function(X) < 0, -1, 1)
+
+
+def compile_forest(model):
+    # Compiled copy of a fitted IsolationForest; anything already compiled is returned as is
+    return model if isinstance(model, CompiledIsolationForest) else CompiledIsolationForest(model)
+
+
+def load_forest_arrays(directory, info, mmap_mode='r'):
+    return CompiledIsolationForest.from_arrays(
+        {name: np.load(f"{directory}/{name}.npy", mmap_mode=mmap_mode) for name in ARRAY_NAMES}, info)
+
+
+def load_isolation_forest(path="isolation_forest.pkl"):
+    # Load a pickled IsolationForest and compile it for scoring
+    return compile_forest(joblib.load(path))
@@ -0,0 +1,74 @@
+import os
+import threading
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from dataset import DATASET_PATH, file_version, load_dataset
+
+# Columns that identify a customer (same identity the Customer Analysis page uses)
+IDENTITY_COLUMNS = ['dob', 'city', 'job']
+
+# path -> CustomerIndex for the current dataset version
+_cache = {}
+_lock = threading.Lock()
+
+
+def _identity_frame(df):
+    identity = pd.DataFrame({col: df[col] for col in IDENTITY_COLUMNS})
+    if pd.api.types.is_datetime64_any_dtype(identity['dob']):
+        identity['dob'] = identity['dob'].dt.strftime('%Y-%m-%d')
+    return identity.astype(str)
+
+
+def customer_keys(df):
+    # 64-bit hash of the identity columns, computed in one vectorized pass
+    return pd.util.hash_pandas_object(_identity_frame(df), index=False).to_numpy()
+
+
+class CustomerIndex:
+    # Dense customer ids per row plus an offset index, so one customer's rows are a slice
+
+    def __init__(self, keys, customer_ids, version=None):
+        self.keys = keys  # uint64 hash per row
+        self.customer_ids = customer_ids  # int32 id per row
+        self.version = version
+        self.n_customers = int(customer_ids.max()) + 1 if len(customer_ids) else 0
+        # Rows grouped by customer id; customer c owns order[offsets[c]:offsets[c + 1]]
+        self.order = np.argsort(customer_ids, kind='stable')
+        self.offsets = np.zeros(self.n_customers + 1, dtype=np.int64)
+        np.cumsum(np.bincount(customer_ids, minlength=self.n_customers), out=self.offsets[1:])
+
+    @classmethod
+    def build(cls, df, version=None):
+        keys = customer_keys(df)
+        _, first_rows, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        # Number customers by their sorted dob + city + job label, as the page always has;
+        # only one label per customer is built, not one per row
+        identity = _identity_frame(df.iloc[first_rows])
+        labels = identity['dob'] + identity['city'] + identity['job']
+        ranks = np.empty(len(labels), dtype=np.int32)
+        ranks[np.argsort(labels.to_numpy(), kind='stable')] = np.arange(len(labels), dtype=np.int32)
+        return cls(keys, ranks[inverse.ravel()], version)
+
+    def rows(self, customer_id):
+        # Row positions of one customer, without scanning the frame
+        if not 0 <= customer_id < self.n_customers:
+            return self.order[:0]
+        return self.order[self.offsets[customer_id]:self.offsets[customer_id + 1]]
+
+
+def load_customer_index(path=DATASET_PATH):
+    # Index for the current version of path; persisted next to it and memory-mapped on load
+    version = file_version(path)
+    index_path = f"{path}.customers.pkl"
+    with _lock:
+        index = _cache.get(path)
+        if index is None and os.path.exists(index_path):
+            index = joblib.load(index_path, mmap_mode='r')
+        if index is None or index.version != version:
+            index = CustomerIndex.build(load_dataset(path), version)
+            joblib.dump(index, index_path)
+        _cache[path] = index
+        return index
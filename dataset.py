@@ -0,0 +1,52 @@
+import os
+import threading
+
+import pandas as pd
+
+from date_features import DATE_FORMAT, DATETIME_FORMAT, parse_datetimes
+
+# Dataset behind the dashboard pages
+DATASET_PATH = "credit_card_fraud.csv"
+
+# Pinned dtypes so every load (and every page) sees the same column types
+DTYPES = {
+    'merchant': 'object', 'category': 'object', 'city': 'object', 'state': 'object',
+    'job': 'object', 'trans_num': 'object',
+    'amt': 'float64', 'lat': 'float64', 'long': 'float64', 'merch_lat': 'float64', 'merch_long': 'float64',
+}
+# Date columns and the fixed format each is parsed with
+DATE_COLUMNS = {'trans_date_trans_time': DATETIME_FORMAT, 'dob': DATE_FORMAT}
+
+# path -> (file version, DataFrame); shared by every Streamlit session in the process
+_cache = {}
+_lock = threading.Lock()
+
+
+def file_version(path):
+    # mtime and size change whenever the file is rewritten or appended to
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def read_dataset(path=DATASET_PATH):
+    df = pd.read_csv(path, dtype=DTYPES)
+    for col, fmt in DATE_COLUMNS.items():
+        if col in df.columns:
+            df[col] = pd.Series(parse_datetimes(df[col], fmt), index=df.index)
+    return df
+
+
+def load_dataset(path=DATASET_PATH):
+    # Parse the file once per version; the lock keeps concurrent sessions from loading it twice
+    version = file_version(path)
+    with _lock:
+        cached = _cache.get(path)
+        if cached is None or cached[0] != version:
+            _cache[path] = (version, read_dataset(path))
+        return _cache[path][1]
+
+
+def get_dataset(path=DATASET_PATH):
+    # Shallow copy of the shared frame: pages can add or replace columns without
+    # touching the cached data, and no column data is copied
+    return load_dataset(path).copy(deep=False)
@@ -0,0 +1,111 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# Formats of the dataset's date columns; values in any other format go through pandas' inference
+DATE_FORMAT = "%Y-%m-%d"
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Distinct date strings a DateCache keeps before evicting the least recently used
+DATE_CACHE_SIZE = 100_000
+
+# Calendar parts returned by calendar_parts
+CALENDAR_PARTS = ['year', 'month', 'day', 'hour', 'weekday']
+
+_SECONDS_PER_DAY = 86_400
+_NAT = np.datetime64('NaT', 's')
+
+
+def parse_datetimes(values, fmt=DATETIME_FORMAT):
+    # datetime64[s] array of values; columnar inputs are already timestamps and skip parsing.
+    # Parsing uses the fixed format first and only infers the format of values that don't match it;
+    # unparseable values become NaT, as with errors='coerce'.
+    values = values if isinstance(values, pd.Series) else pd.Series(values, dtype=object)
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values.to_numpy(dtype='datetime64[s]')
+    stamps = pd.to_datetime(values, format=fmt, errors='coerce').to_numpy(dtype='datetime64[s]')
+    failed = np.isnat(stamps) & values.notna().to_numpy()
+    if failed.any():
+        stamps[failed] = pd.to_datetime(values[failed], errors='coerce').to_numpy(dtype='datetime64[s]')
+    return stamps
+
+
+def calendar_parts(stamps):
+    # Year, month, day, hour and weekday (Monday = 0) of a datetime64[s] array in one pass of integer
+    # arithmetic (days-to-civil, proleptic Gregorian). Returns ({part: int32 array}, valid); NaT parts are 0.
+    valid = ~np.isnat(stamps)
+    seconds = np.where(valid, stamps.astype(np.int64), 0)
+    days = seconds // _SECONDS_PER_DAY  # floor, so times before 1970 land on the right day
+    z = days + 719_468  # days since 0000-03-01
+    era = z // 146_097
+    doe = z - era * 146_097
+    yoe = (doe - doe // 1460 + doe // 36_524 - doe // 146_096) // 365
+    doy = doe - (365 * yoe + yoe // 4 - yoe // 100)
+    mp = (5 * doy + 2) // 153  # month counted from March
+    month = np.where(mp < 10, mp + 3, mp - 9)
+    parts = {
+        'year': yoe + era * 400 + (month <= 2),
+        'month': month,
+        'day': doy - (153 * mp + 2) // 5 + 1,
+        'hour': (seconds - days * _SECONDS_PER_DAY) // 3600,
+        'weekday': (days + 3) % 7,  # 1970-01-01 was a Thursday
+    }
+    return {name: np.where(valid, part, 0).astype(np.int32) for name, part in parts.items()}, valid
+
+
+def date_parts(values, fmt=DATE_FORMAT, cache=None):
+    # calendar_parts of a column with few distinct values, like dob: each distinct string is
+    # decoded once per call, or once per process when a DateCache is passed
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return calendar_parts(values.to_numpy(dtype='datetime64[s]'))
+    codes, uniques = pd.factorize(values)  # code -1 = missing
+    uniques = np.asarray(uniques, dtype=object)
+    stamps = cache.parse(uniques) if cache is not None else parse_datetimes(uniques, fmt)
+    return calendar_parts(np.append(stamps, _NAT)[codes])
+
+
+class DateCache:
+    # Bounded LRU of date string -> datetime64[s], shared by the batches (and threads) of a long-lived
+    # process such as the scoring service, where the same customers' dob strings keep coming back
+
+    def __init__(self, max_size=DATE_CACHE_SIZE, fmt=DATE_FORMAT):
+        self.max_size = max_size
+        self.format = fmt
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def parse(self, strings):
+        # datetime64[s] for each of the distinct strings; only the ones not cached are parsed
+        stamps = np.empty(len(strings), dtype='datetime64[s]')
+        missing = []
+        with self._lock:
+            for i, value in enumerate(strings):
+                stamp = self._entries.get(value)
+                if stamp is None:
+                    missing.append(i)
+                else:
+                    self._entries.move_to_end(value)
+                    stamps[i] = stamp
+            self.hits += len(strings) - len(missing)
+            self.misses += len(missing)
+        if missing:
+            new = strings[missing]
+            stamps[missing] = parsed = parse_datetimes(new, self.format)
+            with self._lock:
+                self._entries.update(zip(new, parsed))
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+        return stamps
+
+    def __len__(self):
+        return len(self._entries)
+
+    def summary(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"size": len(self._entries), "hits": self.hits, "misses": self.misses,
+                    "hit_rate": round(self.hits / lookups, 4) if lookups else None}
@@ -0,0 +1,149 @@
+import argparse
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from batch_scoring import FRAUD_LABEL, NORMAL_LABEL, PredictionWriter
+from columnar_store import is_columnar, iter_transaction_chunks, read_transactions
+from detect_fraud_isolate import score_transactions as score_isolation_forest
+from detect_fraud_xgboost import DEFAULT_THRESHOLD, score_transactions as score_xgboost
+from model_registry import load_model
+from stage_metrics import METRICS_DIR, StageMetrics, profiled, stage, timed_iter
+from velocity_store import load_velocity_store
+
+# Models of the ensemble; the cascade's first model scores every row
+MODELS = ["isolation_forest", "xgboost"]
+
+# How the two decisions combine: 'all' flags rows both models flag, 'any' rows either model flags
+COMBINE_RULES = ["all", "any"]
+
+# Columns of the compact Parquet/Arrow output
+ENSEMBLE_COLUMNS = ['trans_num', 'isolation_forest_score', 'xgboost_score', 'label', 'model_version']
+
+# Each model's score on a "higher is more suspicious" scale, which the cascade's pre-threshold is
+# compared with: the negated isolation forest decision (> 0 is flagged) and the XGBoost P(fraud)
+SUSPICION = {
+    "isolation_forest": np.negative,
+    "xgboost": np.asarray,
+}
+
+
+class Ensemble:
+    # Both registry models scored from one preprocessing pass. The first model scores every row; the
+    # second only rows whose first-model suspicion is at least pre_threshold (every row when it's None).
+    # With combine='all' and a pre_threshold at or below the first model's own flagging level, the
+    # cascade flags exactly what scoring every row with both models would.
+
+    def __init__(self, first="isolation_forest", pre_threshold=None, combine="all", threshold=DEFAULT_THRESHOLD):
+        if combine not in COMBINE_RULES:
+            raise ValueError(f"combine must be one of {', '.join(COMBINE_RULES)}")
+        self.order = [first] + [name for name in MODELS if name != first]
+        self.pre_threshold = pre_threshold
+        self.combine = combine
+        self.entries = {name: load_model(name) for name in MODELS}
+        score_functions = {"isolation_forest": score_isolation_forest,
+                           "xgboost": partial(score_xgboost, threshold=threshold)}
+        self.score_fns = {name: partial(score_functions[name], entry.model) for name, entry in self.entries.items()}
+        # Each model keeps its own velocity state, updated with every row whether or not it was scored
+        self.velocity_stores = {name: load_velocity_store(entry.velocity_path) if entry.pipeline.include_velocity
+                                else None for name, entry in self.entries.items()}
+        self.model_version = "+".join(self.entries[name].model_version for name in MODELS)
+        self.second_rows = 0  # rows the second model has scored so far
+
+    def preprocess(self, df):
+        # The first model's pipeline transforms df; the second reuses that matrix (transform_from)
+        first, second = self.order
+        source = self.entries[first].pipeline
+        pipeline = self.entries[second].pipeline
+        with stage("preprocess", len(df)):
+            X_first = source.transform(df, self.velocity_stores[first])
+            X_second = pipeline.transform_from(df, source, X_first, self.velocity_stores[second])
+        return {first: pd.DataFrame(X_first, columns=source.feature_names, copy=False),
+                second: pd.DataFrame(X_second, columns=pipeline.feature_names, copy=False)}
+
+    def predict(self, df):
+        # ({model: scores, NaN where the cascade skipped the row}, combined is_fraud)
+        features = self.preprocess(df)
+        first, second = self.order
+        with stage(f"predict_{first}", len(df)):
+            first_scores, first_flags = self.score_fns[first](features[first])
+        rows = np.arange(len(df))
+        if self.pre_threshold is not None:
+            rows = np.flatnonzero(SUSPICION[first](first_scores) >= self.pre_threshold)
+        second_scores = np.full(len(df), np.nan)
+        second_flags = np.zeros(len(df), dtype=bool)
+        with stage(f"predict_{second}", len(rows)):
+            if len(rows):
+                second_scores[rows], second_flags[rows] = self.score_fns[second](features[second].iloc[rows])
+        self.second_rows += len(rows)
+        is_fraud = first_flags & second_flags if self.combine == "all" else first_flags | second_flags
+        return {first: first_scores, second: second_scores}, is_fraud
+
+    def save_velocity(self):
+        for name, velocity_store in self.velocity_stores.items():
+            if velocity_store is not None:
+                velocity_store.save(self.entries[name].velocity_path)
+
+
+def detect_fraud_ensemble(input_path="fake_transactions.csv", output_path="predictions_ensemble.csv", chunksize=None,
+                          first="isolation_forest", pre_threshold=None, combine="all", threshold=DEFAULT_THRESHOLD,
+                          flagged_only=False):
+    # CSV output gets every input column plus both scores and the combined prediction;
+    # a .parquet/.arrow output_path gets ENSEMBLE_COLUMNS
+    with stage("load_model"):
+        ensemble = Ensemble(first, pre_threshold, combine, threshold)
+
+    chunks = iter_transaction_chunks(input_path, chunksize) if chunksize else iter([read_transactions(input_path)])
+    writer = PredictionWriter(output_path, ensemble.model_version, flagged_only, ENSEMBLE_COLUMNS) \
+        if is_columnar(output_path) else None
+    total_rows = flagged = 0
+    try:
+        for i, df in enumerate(timed_iter("read", chunks)):
+            scores, is_fraud = ensemble.predict(df)
+            score_columns = {f"{name}_score": scores[name] for name in MODELS}
+            with stage("write", len(df)):
+                if writer is not None:
+                    writer.write(df, score_columns, is_fraud)
+                else:
+                    df = df.drop(columns=['is_fraud'], errors='ignore').assign(**score_columns)
+                    df['prediction'] = np.where(is_fraud, FRAUD_LABEL, NORMAL_LABEL)
+                    if flagged_only:
+                        df = df[is_fraud]
+                    df.to_csv(output_path, mode='w' if i == 0 else 'a', header=(i == 0), index=False)
+            total_rows += len(is_fraud)
+            flagged += int(is_fraud.sum())
+    finally:
+        if writer is not None:
+            writer.close()
+    ensemble.save_velocity()
+
+    second = ensemble.order[1]
+    print(f"✅ {flagged} of {total_rows} transactions flagged ({combine} of both models) into {output_path}")
+    print(f"✅ {second} scored {ensemble.second_rows} of {total_rows} transactions")
+    return total_rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score transactions with both models from one preprocessing pass")
+    parser.add_argument("--input", default="fake_transactions.csv", help="CSV, Parquet or Arrow file")
+    parser.add_argument("--output", default="predictions_ensemble.csv",
+                        help="CSV gets every column; .parquet/.arrow gets the compact columns")
+    parser.add_argument("--chunksize", type=int, default=None, help="Stream the input in chunks of this many rows")
+    parser.add_argument("--first", choices=MODELS, default="isolation_forest",
+                        help="Model that scores every row; the other one runs second")
+    parser.add_argument("--pre-threshold", type=float, default=None,
+                        help="Only rows whose first-model suspicion (negated isolation forest score, or XGBoost "
+                             "fraud probability) reaches this are scored by the second model; default: every row")
+    parser.add_argument("--combine", choices=COMBINE_RULES, default="all",
+                        help="Flag rows both models flag (all) or that either model flags (any)")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Fraud probability that flags a transaction in XGBoost")
+    parser.add_argument("--flagged-only", action="store_true", help="Write only the transactions flagged as fraud")
+    parser.add_argument("--metrics-dir", default=METRICS_DIR, help="Where the JSON log and Prometheus file go")
+    parser.add_argument("--profile", default=None, help="Also run under cProfile and save the stats to this file")
+    args = parser.parse_args()
+    with StageMetrics("detect_fraud_ensemble") as run, profiled(args.profile):
+        detect_fraud_ensemble(args.input, args.output, args.chunksize, args.first, args.pre_threshold, args.combine,
+                              args.threshold, args.flagged_only)
+    run.print_report()
+    print(f"✅ Stage metrics saved to {run.save(args.metrics_dir)}")
@@ -65,74 +65,102 @@
 # # Run the detection function
 # detect_fraud()
 
-import pandas as pd
-import joblib
-from sklearn.preprocessing import LabelEncoder
-from sklearn.ensemble import IsolationForest
-
-# Function to preprocess the new data, including label encoding and handling unseen labels
-def preprocess_data(df, label_encoders=None):
-    # Drop unnecessary columns
-    df = df.drop(columns=['trans_num', 'merchant','is_fraud'], errors='ignore')  # Avoid errors if columns are not present
-
-    # Convert 'dob' column (if present) to datetime, and extract relevant features
-    if 'dob' in df.columns:
-        df['dob'] = pd.to_datetime(df['dob'], errors='coerce')
-        df['dob_year'] = df['dob'].dt.year
-        df['dob_month'] = df['dob'].dt.month
-        df['dob_day'] = df['dob'].dt.day
-        df = df.drop(columns=['dob'])
-
-    # Convert 'trans_date_trans_time' to datetime and extract features
-    df['trans_date_trans_time'] = pd.to_datetime(df['trans_date_trans_time'], errors='coerce')
-    df['hour'] = df['trans_date_trans_time'].dt.hour
-    df['day'] = df['trans_date_trans_time'].dt.day
-    df['month'] = df['trans_date_trans_time'].dt.month
-    df = df.drop(columns=['trans_date_trans_time'])
-
-    # Encode categorical variables
-    label_encoders = label_encoders or {}
-    categorical_cols = ['category', 'state', 'job', 'city']
-
-    for col in categorical_cols:
-        le = label_encoders.get(col, LabelEncoder())
-        if col not in label_encoders:
-            le.fit(df[col].astype(str))  # Fit encoder only if not done before (for new data)
-            label_encoders[col] = le
-
-        df[col] = df[col].astype(str)
-        df[col] = le.transform(df[col].where(df[col].isin(le.classes_), le.classes_[0]))
-
-    # Fill missing values
-    df = df.fillna(0)
-
-    return df
-
-def detect_fraud():
-    # Load the trained model and label encoders
-    model = joblib.load("isolation_forest.pkl")
-    label_encoders = joblib.load("label_encoders.pkl")
+import argparse
+from functools import partial
+from columnar_store import is_columnar, read_transactions
+from batch_scoring import (FRAUD_LABEL, predict_frame, score_frame, score_csv_streaming, score_csv_parallel,
+                           write_compact)
+from model_registry import load_model
+from prediction_cache import PREDICTION_CACHE_PATH, open_cache
+from velocity_store import load_velocity_store
+from stage_metrics import METRICS_DIR, StageMetrics, profiled, stage
+
+# Anomaly score and fraud flag (decision_function < 0 is what predict() reports as -1 = Fraud)
+def score_transactions(model, features):
+    scores = model.decision_function(features)
+    return scores, scores < 0
+
+def detect_fraud(input_path="fake_transactions.csv", output_path="predictions.csv", chunksize=None,
+                 workers=None, flagged_only=False, cache=None):
+    # A .parquet/.arrow output_path gets the compact columns (trans_num, score, label, model_version);
+    # with a PredictionCache, transactions already scored by this model version aren't scored again.
+    # The model, its feature pipeline and its version label come from the registry, as in the app
+    # and the scoring service (the trainer's isolation_forest.pkl before anything is published).
+    with stage("load_model"):
+        entry = load_model("isolation_forest")
+    model_version = entry.model_version
+
+    # Parallel mode: workers load the model themselves and score byte ranges of the input
+    if workers:
+        if cache is not None:
+            raise ValueError("the prediction cache needs whole-file or chunked mode; workers read the input themselves")
+        total_rows = score_csv_parallel(input_path, output_path, entry.model_path, entry.pipeline_path,
+                                        score_transactions, workers, entry.load_model, model_version,
+                                        flagged_only)
+        print(f"✅ Scored {total_rows} transactions into {output_path}")
+        return
+
+    # Model compiled into flat node arrays, and the feature pipeline
+    pipeline = entry.pipeline
+    # Per-customer velocity state carried over from training and earlier runs
+    velocity_store = load_velocity_store(entry.velocity_path) if pipeline.include_velocity else None
+
+    score_fn = partial(score_transactions, entry.model)
+
+    # Streaming mode: score and append the input chunk by chunk
+    if chunksize:
+        total_rows = score_csv_streaming(input_path, output_path, pipeline, score_fn, chunksize, velocity_store,
+                                         model_version, flagged_only, cache, model_version)
+        if velocity_store is not None:
+            velocity_store.save(entry.velocity_path)
+        print(f"✅ Scored {total_rows} transactions into {output_path}")
+        return
 
     # Load new/fake transaction data
-    df_fake = pd.read_csv("fake_transactions.csv")
-
-    # Preprocess the data the same way as during training
-    df_fake = preprocess_data(df_fake, label_encoders)
-
-    # Make predictions using the trained model
-    predictions = model.predict(df_fake)
-
-    # Map predictions (-1 = Fraud, 1 = Normal)
-    prediction_labels = ["Fraud Transaction" if pred == -1 else "Normal Transaction" for pred in predictions]
-
-    # Add the predictions to the dataframe
-    df_fake['prediction'] = prediction_labels
+    with stage("read") as record:
+        df_fake = read_transactions(input_path)
+        record['rows'] = len(df_fake)
+
+    # Compact output: only the IDs, scores and labels are written, no label strings are built
+    if is_columnar(output_path):
+        scores, is_fraud = predict_frame(df_fake, pipeline, score_fn, velocity_store, cache, model_version)
+        if velocity_store is not None:
+            velocity_store.save(entry.velocity_path)
+        rows = write_compact(output_path, df_fake, scores, is_fraud, model_version, flagged_only)
+        print(f"✅ {int(is_fraud.sum())} of {len(df_fake)} transactions flagged; {rows} rows written to {output_path}")
+        return
+
+    # Preprocess the data the same way as during training and predict
+    df_fake = score_frame(df_fake, pipeline, score_fn, velocity_store, cache, model_version)
+    if velocity_store is not None:
+        velocity_store.save(entry.velocity_path)
 
     # Print results in the desired format
     print(df_fake[['prediction']].head())  # Display prediction column
 
     # Optionally, save predictions to CSV file
-    df_fake.to_csv("predictions.csv", index=False)  # Save predictions to CSV file
+    if flagged_only:
+        df_fake = df_fake[df_fake['prediction'] == FRAUD_LABEL]
+    with stage("write", len(df_fake)):
+        df_fake.to_csv(output_path, index=False)  # Save predictions to CSV file
 
 # Run the detection function
-detect_fraud()
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score transactions with the Isolation Forest model")
+    parser.add_argument("--input", default="fake_transactions.csv", help="CSV, Parquet or Arrow file")
+    parser.add_argument("--output", default="predictions.csv",
+                        help="CSV gets every column; .parquet/.arrow gets the compact columns")
+    parser.add_argument("--chunksize", type=int, default=None, help="Stream the input in chunks of this many rows")
+    parser.add_argument("--workers", type=int, default=None, help="Score partitions of the input in this many processes")
+    parser.add_argument("--flagged-only", action="store_true", help="Write only the transactions flagged as fraud")
+    parser.add_argument("--cache", nargs="?", const=PREDICTION_CACHE_PATH, default=None, metavar="PATH",
+                        help="Reuse and store predictions in this prediction cache file, keyed by trans_num")
+    parser.add_argument("--metrics-dir", default=METRICS_DIR, help="Where the JSON log and Prometheus file go")
+    parser.add_argument("--profile", default=None, help="Also run under cProfile and save the stats to this file")
+    args = parser.parse_args()
+    with StageMetrics("detect_fraud_isolate") as run, profiled(args.profile), open_cache(args.cache) as cache:
+        detect_fraud(args.input, args.output, args.chunksize, args.workers, args.flagged_only, cache)
+    run.print_report()
+    if cache is not None:
+        print(f"✅ Prediction cache: {cache.hits} hits, {cache.misses} misses, {len(cache):,} entries")
+    print(f"✅ Stage metrics saved to {run.save(args.metrics_dir)}")
@@ -1,65 +1,130 @@
-import pandas as pd
-import joblib
-import xgboost as xgb
-from sklearn.preprocessing import LabelEncoder
-from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score, confusion_matrix
-
-
-# Function to preprocess new transaction data
-def preprocess_data(df, label_encoders=None):
-    # Drop unnecessary columns, including target variable 'is_fraud'
-    df = df.drop(columns=['trans_num', 'merchant', 'is_fraud'], errors='ignore')  # Ignore 'is_fraud' if present
-
-    if 'dob' in df.columns:
-        df['dob'] = pd.to_datetime(df['dob'], errors='coerce')
-        df['dob_year'] = df['dob'].dt.year
-        df['dob_month'] = df['dob'].dt.month
-        df['dob_day'] = df['dob'].dt.day
-        df = df.drop(columns=['dob'])
-
-    df['trans_date_trans_time'] = pd.to_datetime(df['trans_date_trans_time'], errors='coerce')
-    df['hour'] = df['trans_date_trans_time'].dt.hour
-    df['day'] = df['trans_date_trans_time'].dt.day
-    df['month'] = df['trans_date_trans_time'].dt.month
-    df = df.drop(columns=['trans_date_trans_time'])
-
-    label_encoders = label_encoders or {}
-    categorical_cols = ['category', 'state', 'job', 'city']
-
-    for col in categorical_cols:
-        le = label_encoders.get(col, LabelEncoder())
-        if col not in label_encoders:
-            le.fit(df[col].astype(str))  # Fit only if not preloaded
-            label_encoders[col] = le
-        df[col] = le.transform(df[col].astype(str).where(df[col].isin(le.classes_), le.classes_[0]))
-
-    df = df.fillna(0)  # Handle missing values
-    return df
-
-def detect_fraud_xgboost():
-    # Load trained model and encoders
-    model = joblib.load("xgboost_model.pkl")  # Ensure this is an XGBClassifier
-    label_encoders = joblib.load("label_encoders_xgboost.pkl")
+import argparse
+import numpy as np
+from functools import partial
+from columnar_store import is_columnar, read_transactions
+from batch_scoring import (FRAUD_LABEL, predict_frame, score_frame, score_csv_streaming, score_csv_parallel,
+                           write_compact)
+from model_registry import load_model
+from prediction_cache import PREDICTION_CACHE_PATH, open_cache
+from velocity_store import load_velocity_store
+from stage_metrics import METRICS_DIR, StageMetrics, profiled, stage
+
+
+# Fraud probability above which a transaction is flagged
+DEFAULT_THRESHOLD = 0.5
+
+
+# Booster fast path: in-place prediction on the contiguous float32 feature matrix,
+# skipping the XGBClassifier/DMatrix wrappers (binary:logistic gives P(fraud))
+def _iteration_range(model):
+    # Trees up to the early-stopping best iteration, as XGBClassifier.predict_proba uses;
+    # (0, 0) means every tree, for models trained without early stopping
+    try:
+        return 0, model.best_iteration + 1
+    except AttributeError:
+        return 0, 0
+
+
+def fraud_probabilities(model, features):
+    booster = model.get_booster() if hasattr(model, 'get_booster') else model
+    return booster.inplace_predict(np.ascontiguousarray(features, dtype=np.float32), validate_features=False,
+                                   iteration_range=_iteration_range(model))
+
+
+def score_transactions(model, features, threshold=DEFAULT_THRESHOLD):
+    probabilities = fraud_probabilities(model, features)
+    return probabilities, probabilities > threshold
+
+
+def cache_key(model_version, threshold=DEFAULT_THRESHOLD):
+    # Prediction cache key: flags depend on the threshold, so other thresholds get their own entries
+    return model_version if threshold == DEFAULT_THRESHOLD else f"{model_version}@threshold={threshold:g}"
+
+
+def detect_fraud_xgboost(input_path="fake_transactions.csv", output_path="predictions_XGBoost.csv", chunksize=None,
+                         workers=None, threshold=DEFAULT_THRESHOLD, flagged_only=False, cache=None):
+    # A .parquet/.arrow output_path gets the compact columns (trans_num, score, label, model_version);
+    # with a PredictionCache, transactions already scored by this model version aren't scored again.
+    # The model, its feature pipeline and its version label come from the registry, as in the app
+    # and the scoring service (the trainer's xgboost_model.pkl before anything is published).
+    with stage("load_model"):
+        entry = load_model("xgboost")
+    model_version = entry.model_version
+    key = cache_key(model_version, threshold)
+
+    # Parallel mode: workers load the model themselves and score byte ranges of the input
+    if workers:
+        if cache is not None:
+            raise ValueError("the prediction cache needs whole-file or chunked mode; workers read the input themselves")
+        total_rows = score_csv_parallel(input_path, output_path, entry.model_path, entry.pipeline_path,
+                                        partial(score_transactions, threshold=threshold), workers,
+                                        entry.load_model, model_version, flagged_only)
+        print(f"✅ Scored {total_rows} transactions into {output_path}")
+        return
+
+    # XGBClassifier and feature pipeline
+    pipeline = entry.pipeline
+    # Per-customer velocity state carried over from training and earlier runs
+    velocity_store = load_velocity_store(entry.velocity_path) if pipeline.include_velocity else None
+
+    score_fn = partial(score_transactions, entry.model, threshold=threshold)
+
+    # Streaming mode: score and append the input chunk by chunk
+    if chunksize:
+        total_rows = score_csv_streaming(input_path, output_path, pipeline, score_fn, chunksize, velocity_store,
+                                         model_version, flagged_only, cache, key)
+        if velocity_store is not None:
+            velocity_store.save(entry.velocity_path)
+        print(f"✅ Scored {total_rows} transactions into {output_path}")
+        return
 
     # Load new transaction data
-    df_fake = pd.read_csv("fake_transactions.csv")
-
-    # Preprocess the data
-    df_fake = preprocess_data(df_fake, label_encoders)
-
-    # 🔥 **FIXED:** Pass DataFrame directly instead of converting to DMatrix
-    predictions = model.predict(df_fake)
-
-    # Convert to labels
-    prediction_labels = ["Fraud Transaction" if pred > 0.5 else "Normal Transaction" for pred in predictions]
-
-    df_fake['prediction'] = prediction_labels
+    with stage("read") as record:
+        df_fake = read_transactions(input_path)
+        record['rows'] = len(df_fake)
+
+    # Compact output: only the IDs, scores and labels are written, no label strings are built
+    if is_columnar(output_path):
+        scores, is_fraud = predict_frame(df_fake, pipeline, score_fn, velocity_store, cache, key)
+        if velocity_store is not None:
+            velocity_store.save(entry.velocity_path)
+        rows = write_compact(output_path, df_fake, scores, is_fraud, model_version, flagged_only)
+        print(f"✅ {int(is_fraud.sum())} of {len(df_fake)} transactions flagged; {rows} rows written to {output_path}")
+        return
+
+    # Preprocess the data and predict
+    df_fake = score_frame(df_fake, pipeline, score_fn, velocity_store, cache, key)
+    if velocity_store is not None:
+        velocity_store.save(entry.velocity_path)
 
     # Show results
     print(df_fake[['prediction']].head())  # Display the predictions
 
     # Save predictions to CSV
-    df_fake.to_csv("predictions_XGBoost.csv", index=False)  # Save predictions to CSV file
-
-
-detect_fraud_xgboost()
\ No newline at end of file
+    if flagged_only:
+        df_fake = df_fake[df_fake['prediction'] == FRAUD_LABEL]
+    with stage("write", len(df_fake)):
+        df_fake.to_csv(output_path, index=False)  # Save predictions to CSV file
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score transactions with the XGBoost model")
+    parser.add_argument("--input", default="fake_transactions.csv", help="CSV, Parquet or Arrow file")
+    parser.add_argument("--output", default="predictions_XGBoost.csv",
+                        help="CSV gets every column; .parquet/.arrow gets the compact columns")
+    parser.add_argument("--chunksize", type=int, default=None, help="Stream the input in chunks of this many rows")
+    parser.add_argument("--workers", type=int, default=None, help="Score partitions of the input in this many processes")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Fraud probability that flags a transaction")
+    parser.add_argument("--flagged-only", action="store_true", help="Write only the transactions flagged as fraud")
+    parser.add_argument("--cache", nargs="?", const=PREDICTION_CACHE_PATH, default=None, metavar="PATH",
+                        help="Reuse and store predictions in this prediction cache file, keyed by trans_num")
+    parser.add_argument("--metrics-dir", default=METRICS_DIR, help="Where the JSON log and Prometheus file go")
+    parser.add_argument("--profile", default=None, help="Also run under cProfile and save the stats to this file")
+    args = parser.parse_args()
+    with StageMetrics("detect_fraud_xgboost") as run, profiled(args.profile), open_cache(args.cache) as cache:
+        detect_fraud_xgboost(args.input, args.output, args.chunksize, args.workers, args.threshold, args.flagged_only,
+                             cache)
+    run.print_report()
+    if cache is not None:
+        print(f"✅ Prediction cache: {cache.hits} hits, {cache.misses} misses, {len(cache):,} entries")
+    print(f"✅ Stage metrics saved to {run.save(args.metrics_dir)}")
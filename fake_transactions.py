@@ -1,57 +1,251 @@
-import pandas as pd
+import argparse
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
+import pandas as pd
 from faker import Faker
-import random
-
-fake = Faker()
-
-
-def generate_fake_transactions(num_samples=5000):
-    transactions = []
-
-    # Original categories list
-    original_categories = ['grocery_pos', 'entertainment', 'shopping_pos', 'misc_pos',
-                           'shopping_net', 'gas_transport', 'misc_net', 'grocery_net',
-                           'food_dining', 'health_fitness', 'kids_pets', 'home',
-                           'personal_care', 'travel']
-
-    for _ in range(num_samples):
-        transaction = {
-            "trans_date_trans_time": fake.date_time_this_decade(),
-            "merchant": fake.company(),
-            "category": random.choice(original_categories),  # Updated categories
-            "amt": round(random.uniform(1, 5000), 2),
-            "city": fake.city(),
-            "state": fake.state(),
-            "lat": round(fake.latitude(), 6),
-            "long": round(fake.longitude(), 6),
-            "city_pop": random.randint(1000, 1000000),
-            "job": fake.job(),
-            "dob": fake.date_of_birth(minimum_age=18, maximum_age=80),
-            "trans_num": fake.uuid4(),
-            "merch_lat": round(fake.latitude(), 6),
-            "merch_long": round(fake.longitude(), 6),
-            "is_fraud": random.choices([0, 1], weights=[98, 2])[0]  # 2% fraud rate
-        }
-        transactions.append(transaction)
-
-    df_fake = pd.DataFrame(transactions)
+
+from columnar_store import PARQUET_EXTENSIONS, arrow_schema
+
+# Original categories list
+CATEGORIES = ['grocery_pos', 'entertainment', 'shopping_pos', 'misc_pos',
+              'shopping_net', 'gas_transport', 'misc_net', 'grocery_net',
+              'food_dining', 'health_fitness', 'kids_pets', 'home',
+              'personal_care', 'travel']
+
+# Distinct merchants, cities and jobs drawn from Faker once; rows then sample these pools with NumPy
+POOL_SIZES = {'merchant': 1000, 'city': 1000, 'job': 1000}
+
+# Customers per generated transaction when no customer count is given (about 100 transactions each)
+ROWS_PER_CUSTOMER = 100
+
+# Transactions fall in [START, END); chunk k covers the k-th slice, so files come out in time order
+START = np.datetime64('2020-01-01T00:00:00', 's')
+END = np.datetime64('2025-01-01T00:00:00', 's')
+
+# Customers are 18 to 80 years old at START
+DOB_RANGE = (np.datetime64('1940-01-01', 'D'), np.datetime64('2002-01-01', 'D'))
+
+# Share of rows labelled as fraud (the old 98/2 coin flip)
+FRAUD_RATE = 0.02
+
+# Optional fraud patterns; without any, fraud is a flat coin flip with nothing to learn from
+FRAUD_PATTERNS = ['velocity_burst', 'distant_merchant', 'odd_hours']
+
+# A velocity burst is 3-8 fraudulent transactions of one customer within BURST_SECONDS
+BURST_SIZE = (3, 9)
+BURST_SECONDS = 30 * 60
+
+# Genuine merchants lie within about this many degrees of the customer's home
+LOCAL_DEGREES = 0.5
+
+# Rows generated, formatted and written per chunk
+DEFAULT_CHUNKSIZE = 1_000_000
+
+# Value pools of the current process, set by _init_worker in generator processes
+_worker = {}
+
+
+def build_pools(customers, seed=0):
+    # Everything rows are drawn from: Faker names for merchants/cities/jobs (the only per-value
+    # Python calls) and a vectorized customer table built from them
+    fake = Faker()
+    fake.seed_instance(seed)
+    rng = np.random.default_rng([seed, 0xC0FFEE])
+
+    cities = pd.DataFrame({
+        'city': [fake.city() for _ in range(POOL_SIZES['city'])],
+        'state': [fake.state() for _ in range(POOL_SIZES['city'])],
+        'lat': rng.uniform(-90, 90, POOL_SIZES['city']),
+        'long': rng.uniform(-180, 180, POOL_SIZES['city']),
+        'city_pop': rng.integers(1000, 1000000, POOL_SIZES['city']),
+    }).drop_duplicates('city', ignore_index=True)
+    merchants = pd.unique(np.array([fake.company() for _ in range(POOL_SIZES['merchant'])], dtype=object))
+    jobs = pd.unique(np.array([fake.job() for _ in range(POOL_SIZES['job'])], dtype=object))
+
+    states = pd.Index(pd.unique(cities['state']))
+
+    # Customers live near the centre of their city
+    city = rng.integers(0, len(cities), customers)
+    dob_days = rng.integers(0, (DOB_RANGE[1] - DOB_RANGE[0]).astype(np.int64), customers)
+    return {
+        'cities': cities,
+        'states': states.to_numpy(),
+        'city_state': states.get_indexer(cities['state']).astype(np.int32),
+        'merchants': merchants,
+        'jobs': jobs,
+        'customer_city': city.astype(np.int32),
+        'customer_job': rng.integers(0, len(jobs), customers).astype(np.int32),
+        'customer_dob': DOB_RANGE[0] + dob_days.astype('timedelta64[D]'),
+        'customer_lat': np.clip(cities['lat'].to_numpy()[city] + rng.normal(0, 0.05, customers), -90, 90),
+        'customer_long': np.clip(cities['long'].to_numpy()[city] + rng.normal(0, 0.05, customers), -180, 180),
+    }
+
+
+def _categorical(codes, categories):
+    # Pool values as a categorical: cheap to build, and every chunk shares one dictionary
+    return pd.Categorical.from_codes(codes, categories=pd.Index(categories, dtype=object), validate=False)
+
+
+def _trans_nums(rng, rows):
+    # 128 random bits per row as 32 hex characters (the uuid4().hex shape), seeded like the rest
+    return np.frombuffer(rng.bytes(16 * rows).hex().encode(), dtype='S32').astype(str).astype(object)
+
+
+def generate_chunk(pools, rows, seed, k=0, n_chunks=1, fraud_rate=FRAUD_RATE, fraud_patterns=()):
+    # Chunk k of n_chunks as a DataFrame; seeded by (seed, k) so the output does not depend on
+    # the number of worker processes
+    rng = np.random.default_rng([seed, k])
+    span = int((END - START) / np.timedelta64(1, 's'))
+    slice_start, slice_end = span * k // n_chunks, span * (k + 1) // n_chunks
+
+    customer = rng.integers(0, len(pools['customer_city']), rows)
+    seconds = rng.integers(slice_start, slice_end, rows)
+    home_lat, home_long = pools['customer_lat'][customer], pools['customer_long'][customer]
+    merch_lat = np.clip(home_lat + rng.normal(0, LOCAL_DEGREES, rows), -90, 90)
+    merch_long = np.clip(home_long + rng.normal(0, LOCAL_DEGREES, rows), -180, 180)
+    # Typical card spend: median around $45 with a long tail
+    amt = np.exp(rng.normal(3.8, 1.0, rows))
+
+    is_fraud = rng.random(rows) < fraud_rate
+    if fraud_patterns:
+        fraud = np.flatnonzero(is_fraud)
+        pattern = rng.integers(0, len(fraud_patterns), len(fraud))
+        amt[fraud] = np.exp(rng.normal(5.5, 1.0, len(fraud)))  # stolen cards buy bigger tickets
+        for i, name in enumerate(fraud_patterns):
+            rows_i = fraud[pattern == i]
+            if name == 'velocity_burst':
+                # Consecutive fraud rows form bursts that share a customer and a short time window
+                burst = np.repeat(np.arange(len(rows_i)), rng.integers(*BURST_SIZE, len(rows_i)))[:len(rows_i)]
+                customer[rows_i] = rng.integers(0, len(pools['customer_city']), len(rows_i))[burst]
+                home_lat, home_long = pools['customer_lat'][customer], pools['customer_long'][customer]
+                merch_lat[rows_i] = np.clip(home_lat[rows_i] + rng.normal(0, LOCAL_DEGREES, len(rows_i)), -90, 90)
+                merch_long[rows_i] = np.clip(home_long[rows_i] + rng.normal(0, LOCAL_DEGREES, len(rows_i)),
+                                             -180, 180)
+                base = rng.integers(slice_start, max(slice_start + 1, slice_end - BURST_SECONDS), len(rows_i))[burst]
+                seconds[rows_i] = base + rng.integers(0, BURST_SECONDS, len(rows_i))
+            elif name == 'distant_merchant':
+                merch_lat[rows_i] = rng.uniform(-90, 90, len(rows_i))
+                merch_long[rows_i] = rng.uniform(-180, 180, len(rows_i))
+            elif name == 'odd_hours':
+                # Same day, moved to between 1am and 5am
+                day = (seconds[rows_i] // 86400) * 86400
+                seconds[rows_i] = np.maximum(day + rng.integers(3600, 5 * 3600, len(rows_i)), slice_start)
+            else:
+                raise ValueError(f"unknown fraud pattern {name!r}; expected one of {FRAUD_PATTERNS}")
+
+    order = np.argsort(seconds, kind='stable')
+    customer, city = customer[order], pools['customer_city'][customer[order]]
+    cities = pools['cities']
+    return pd.DataFrame({
+        'trans_date_trans_time': START + seconds[order].astype('timedelta64[s]'),
+        'merchant': _categorical(rng.integers(0, len(pools['merchants']), rows), pools['merchants']),
+        'category': _categorical(rng.integers(0, len(CATEGORIES), rows), CATEGORIES),
+        'amt': np.round(np.clip(amt[order], 1, 5000), 2),
+        'city': _categorical(city, cities['city']),
+        'state': _categorical(pools['city_state'][city], pools['states']),
+        'lat': np.round(pools['customer_lat'][customer], 6),
+        'long': np.round(pools['customer_long'][customer], 6),
+        'city_pop': cities['city_pop'].to_numpy()[city],
+        'job': _categorical(pools['customer_job'][customer], pools['jobs']),
+        'dob': pools['customer_dob'][customer].astype('datetime64[s]'),
+        'trans_num': _trans_nums(rng, rows),
+        'merch_lat': np.round(merch_lat[order], 6),
+        'merch_long': np.round(merch_long[order], 6),
+        'is_fraud': is_fraud[order].astype(np.int8),
+    })
+
+
+def _init_worker(pools):
+    _worker['pools'] = pools
+
+
+def _encode_chunk(path, rows, seed, k, n_chunks, fraud_rate, fraud_patterns, header):
+    # Runs in a worker: generate one chunk and also do the expensive encoding there, so the
+    # parent only appends finished CSV bytes or Arrow tables to the output file
+    import pyarrow as pa  # the bulk writer encodes through Arrow, its CSV writer is ~10x pandas'
+    import pyarrow.csv as pa_csv
+
+    df = generate_chunk(_worker['pools'], rows, seed, k, n_chunks, fraud_rate, fraud_patterns)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    schema = arrow_schema(table.column_names)
+    if str(path).lower().endswith(PARQUET_EXTENSIONS):
+        return table.cast(schema)  # the same typed schema columnar_store.convert_csv writes
+
+    # CSV keeps plain strings and full float64 precision, like the old generator's output
+    schema = pa.schema([pa.field(field.name, pa.string()) if pa.types.is_dictionary(field.type)
+                        else pa.field(field.name, pa.float64()) if pa.types.is_floating(field.type)
+                        else field for field in schema])
+    out = pa.BufferOutputStream()
+    pa_csv.write_csv(table.cast(schema), out, pa_csv.WriteOptions(include_header=header))
+    return out.getvalue().to_pybytes()
+
+
+def write_transactions(path, rows, seed=0, chunksize=DEFAULT_CHUNKSIZE, workers=None, customers=None,
+                       fraud_rate=FRAUD_RATE, fraud_patterns=()):
+    # Stream rows transactions to a CSV or Parquet file, chunk by chunk across worker processes.
+    # At most two chunks per worker are in flight, so memory stays flat however many rows are written.
+    n_chunks = max(1, -(-rows // chunksize))
+    pools = build_pools(customers or max(1, rows // ROWS_PER_CUSTOMER), seed)
+    chunks = [(min(chunksize, rows - k * chunksize), k) for k in range(n_chunks)]
+    workers = workers or os.cpu_count()
+    is_parquet = str(path).lower().endswith(PARQUET_EXTENSIONS)
+
+    writer = None
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(pools,)) as pool, \
+            open(os.devnull if is_parquet else path, 'wb') as f:
+        pending = deque()
+        for chunk_rows, k in chunks:
+            pending.append(pool.submit(_encode_chunk, path, chunk_rows, seed, k, n_chunks, fraud_rate,
+                                       fraud_patterns, k == 0))
+            # Written strictly in chunk order, which is also time order
+            while pending and (len(pending) > 2 * workers or k == n_chunks - 1):
+                out = pending.popleft().result()
+                if is_parquet:
+                    import pyarrow.parquet as pq
+                    writer = writer or pq.ParquetWriter(path, out.schema)
+                    writer.write_table(out)
+                else:
+                    f.write(out)
+    if writer is not None:
+        writer.close()
+    return n_chunks
+
+
+def generate_fake_transactions(num_samples=5000, seed=None, fraud_patterns=(), output_path="fake_transactions.csv"):
+    # Small in-memory dataset for the app and the detect scripts, saved to output_path
+    seed = np.random.SeedSequence().entropy if seed is None else seed
+    pools = build_pools(max(1, num_samples // ROWS_PER_CUSTOMER), seed)
+    df_fake = generate_chunk(pools, num_samples, seed, fraud_patterns=fraud_patterns)
 
     # Save to CSV
-    df_fake.to_csv("fake_transactions.csv", index=False)
+    df_fake.to_csv(output_path, index=False)
 
     return df_fake
 
 
 if __name__ == "__main__":
-    df = generate_fake_transactions(5000)
-    print("✅ Generated fake transactions!")
-# import pandas as pd
-#
-# # Load your fake transactions dataset
-# df_fake = pd.read_csv("fake_transactions.csv")
-#
-# # Assuming 'is_fraud' is the column indicating fraud transactions (1 for fraud, 0 for non-fraud)
-# fraud_count = df_fake['is_fraud'].value_counts()
-#
-# print(fraud_count)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Generate synthetic credit card transactions")
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--output", default="fake_transactions.csv", help="CSV or Parquet file")
+    parser.add_argument("--seed", type=int, default=None, help="Same seed, same rows (default: random)")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE, help="Rows generated per chunk")
+    parser.add_argument("--workers", type=int, default=None, help="Generator processes (default: one per CPU)")
+    parser.add_argument("--customers", type=int, default=None,
+                        help=f"Distinct customers (default: one per {ROWS_PER_CUSTOMER} rows)")
+    parser.add_argument("--fraud-rate", type=float, default=FRAUD_RATE)
+    parser.add_argument("--fraud-patterns", default="",
+                        help=f"Comma-separated subset of {', '.join(FRAUD_PATTERNS)}, or 'all'")
+    args = parser.parse_args()
+
+    patterns = FRAUD_PATTERNS if args.fraud_patterns == "all" else [p for p in args.fraud_patterns.split(",") if p]
+    start = time.perf_counter()
+    seed = np.random.SeedSequence().entropy if args.seed is None else args.seed
+    write_transactions(args.output, args.rows, seed, args.chunksize, args.workers, args.customers,
+                       args.fraud_rate, patterns)
+    seconds = time.perf_counter() - start
+    print(f"✅ Generated {args.rows:,} fake transactions into {args.output} "
+          f"({seconds:.1f}s, {args.rows / seconds:,.0f} rows/s)")
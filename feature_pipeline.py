@@ -0,0 +1,218 @@
+import hashlib
+import os
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from date_features import calendar_parts, date_parts, parse_datetimes
+from stage_metrics import stage
+from velocity_store import VELOCITY_FEATURES
+
+# Columns that are never used as model features
+DROP_COLUMNS = ['trans_num', 'merchant', 'is_fraud']
+
+# Categorical columns encoded through the lookup tables
+CATEGORICAL_COLS = ['category', 'state', 'job', 'city']
+
+# Numeric columns copied straight into the feature matrix
+NUMERIC_COLS = ['amt', 'lat', 'long', 'city_pop', 'merch_lat', 'merch_long']
+
+# Feature order shared by training and scoring (same order the old preprocess_data produced)
+FEATURE_COLUMNS = ['category', 'amt', 'city', 'state', 'lat', 'long', 'city_pop', 'job',
+                   'merch_lat', 'merch_long', 'dob_year', 'dob_month', 'dob_day', 'hour', 'day', 'month']
+
+# Earth radius used by haversine_distance, in km
+EARTH_RADIUS_KM = 6371
+
+
+def haversine_distance(lat1, lon1, lat2, lon2):
+    # Great-circle distance in km, vectorized over whole coordinate arrays
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(x, dtype=np.float64)) for x in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def customer_merchant_distance(df):
+    # Distance between the customer's home and the merchant for every row of df
+    return haversine_distance(df['lat'].to_numpy(), df['long'].to_numpy(),
+                              df['merch_lat'].to_numpy(), df['merch_long'].to_numpy())
+
+
+class FeaturePipeline:
+    # Fitted, picklable replacement for the preprocess_data copies in the scripts
+
+    # Defaults for pipelines pickled before these optional features existed
+    include_distance = False
+    include_velocity = False
+
+    def __init__(self, include_distance=False, include_velocity=False):
+        # include_distance appends the customer-merchant 'distance' feature after FEATURE_COLUMNS;
+        # include_velocity then appends the per-customer VELOCITY_FEATURES from a VelocityStore
+        self.include_distance = include_distance
+        self.include_velocity = include_velocity
+        self.feature_names = (list(FEATURE_COLUMNS) + (['distance'] if include_distance else [])
+                              + (list(VELOCITY_FEATURES) if include_velocity else []))
+        self.lookup_tables = {}  # column -> pd.Index of known labels (hash table lookup)
+
+    @classmethod
+    def from_label_encoders(cls, label_encoders, include_distance=False, include_velocity=False):
+        # Build a pipeline from the old {column: LabelEncoder} pickles
+        pipeline = cls(include_distance, include_velocity)
+        for col in CATEGORICAL_COLS:
+            pipeline.lookup_tables[col] = pd.Index(label_encoders[col].classes_)
+        return pipeline
+
+    def fit(self, df):
+        for col in CATEGORICAL_COLS:
+            # Sorted unique labels, so codes match what LabelEncoder produced
+            self.lookup_tables[col] = pd.Index(np.unique(_as_str(df[col])))
+        return self
+
+    def partial_fit(self, df):
+        # Add the labels of one more chunk; after the last chunk the tables equal fit(all rows)
+        for col in CATEGORICAL_COLS:
+            known = self.lookup_tables.get(col, pd.Index([], dtype=object)).to_numpy(dtype=object)
+            self.lookup_tables[col] = pd.Index(np.unique(np.concatenate([known, _as_str(df[col])])))
+        return self
+
+    def transform(self, df, velocity_store=None, date_cache=None):
+        # velocity_store is required (and updated with df) when the pipeline uses velocity features;
+        # date_cache (a DateCache) keeps decoded dob strings across calls, e.g. in the scoring service
+        if self.include_velocity and velocity_store is None:
+            raise ValueError("this pipeline uses velocity features; pass a VelocityStore")
+        index = {name: i for i, name in enumerate(self.feature_names)}
+        X = np.zeros((len(df), len(self.feature_names)), dtype=np.float32)
+
+        # Sub-stages show up in the stage metrics of the surrounding run (no-ops outside one)
+        with stage("numeric", len(df)):
+            for col in NUMERIC_COLS:
+                X[:, index[col]] = df[col].to_numpy(dtype=np.float32, na_value=0)
+
+        self._encode_categoricals(df, X, index)
+
+        # Fixed formats, each distinct dob decoded once, all calendar parts in one integer pass
+        with stage("parse_dates", len(df)):
+            if 'dob' in df.columns:
+                dob, _ = date_parts(df['dob'], cache=date_cache)
+                X[:, index['dob_year']] = dob['year']
+                X[:, index['dob_month']] = dob['month']
+                X[:, index['dob_day']] = dob['day']
+
+            trans_time, _ = calendar_parts(parse_datetimes(df['trans_date_trans_time']))
+            X[:, index['hour']] = trans_time['hour']
+            X[:, index['day']] = trans_time['day']
+            X[:, index['month']] = trans_time['month']
+
+        if self.include_distance:
+            self._add_distance(df, X, index)
+        if self.include_velocity:
+            self._add_velocity(df, X, index, velocity_store)
+        return X
+
+    def transform_from(self, df, source, features, velocity_store=None):
+        # This pipeline's matrix for df, reusing features = source.transform(df) from another pipeline:
+        # numeric, date and distance columns are copied, categoricals are only re-encoded when the
+        # lookup tables differ, and velocity features come from this pipeline's own store
+        if self.include_velocity and velocity_store is None:
+            raise ValueError("this pipeline uses velocity features; pass a VelocityStore")
+        index = {name: i for i, name in enumerate(self.feature_names)}
+        source_index = {name: i for i, name in enumerate(source.feature_names)}
+        same_encoders = self.encoder_version() == source.encoder_version()
+        shared = [name for name in self.feature_names if name in source_index and name not in VELOCITY_FEATURES
+                  and (same_encoders or name not in CATEGORICAL_COLS)]
+        X = np.zeros((len(df), len(self.feature_names)), dtype=np.float32)
+        with stage("copy_shared", len(df)):
+            X[:, [index[name] for name in shared]] = features[:, [source_index[name] for name in shared]]
+
+        if not same_encoders:
+            self._encode_categoricals(df, X, index)
+        if self.include_distance and 'distance' not in source_index:
+            self._add_distance(df, X, index)
+        if self.include_velocity:
+            self._add_velocity(df, X, index, velocity_store)
+        return X
+
+    def _encode_categoricals(self, df, X, index):
+        # Unseen labels fall back to code 0 (first known class), as before
+        with stage("encode_categoricals", len(df)):
+            for col in CATEGORICAL_COLS:
+                series = df[col]
+                if isinstance(series.dtype, pd.CategoricalDtype):
+                    # Columnar inputs: look each category up once, then gather by code (-1 = missing)
+                    lookup = np.append(self.lookup_tables[col].get_indexer(series.cat.categories.astype(str)),
+                                       self.lookup_tables[col].get_indexer([MISSING_LABEL]))
+                    codes = lookup[series.cat.codes.to_numpy()]
+                else:
+                    codes = self.lookup_tables[col].get_indexer(_as_str(series))
+                codes[codes < 0] = 0
+                X[:, index[col]] = codes
+
+    def _add_distance(self, df, X, index):
+        with stage("distance", len(df)):
+            X[:, index['distance']] = np.nan_to_num(customer_merchant_distance(df))
+
+    def _add_velocity(self, df, X, index, velocity_store):
+        with stage("velocity", len(df)):
+            start = index[VELOCITY_FEATURES[0]]
+            X[:, start:start + len(VELOCITY_FEATURES)] = velocity_store.update_frame(df)
+
+    def fit_transform(self, df, velocity_store=None):
+        return self.fit(df).transform(df, velocity_store)
+
+    def transform_frame(self, df, velocity_store=None, date_cache=None):
+        # Same matrix wrapped with column names, for estimators fitted on DataFrames
+        return pd.DataFrame(self.transform(df, velocity_store, date_cache), columns=self.feature_names, copy=False)
+
+    def save_arrays(self, directory):
+        # Each lookup table as a fixed-width string .npy; returns the settings needed to reload
+        for col in CATEGORICAL_COLS:
+            np.save(os.path.join(directory, f"encoder_{col}.npy"), self.lookup_tables[col].to_numpy(dtype=str))
+        return {'include_distance': self.include_distance, 'include_velocity': self.include_velocity,
+                'encoder_version': self.encoder_version()}
+
+    def encoder_version(self):
+        # Content hash of the lookup tables; equal hashes mean equal category codes
+        digest = hashlib.sha256()
+        for col in CATEGORICAL_COLS:
+            digest.update(col.encode())
+            digest.update('\0'.join(map(str, self.lookup_tables[col])).encode())
+        return digest.hexdigest()[:16]
+
+
+def load_pipeline_arrays(directory, info):
+    # Labels are memory-mapped; only the hash index over them is built in memory
+    pipeline = FeaturePipeline(info['include_distance'], info['include_velocity'])
+    for col in CATEGORICAL_COLS:
+        labels = np.load(os.path.join(directory, f"encoder_{col}.npy"), mmap_mode='r')
+        pipeline.lookup_tables[col] = pd.Index(labels.astype(object))
+    return pipeline
+
+
+# Label of a missing categorical value, as astype(str) produced it for the old LabelEncoders
+MISSING_LABEL = "nan"
+
+
+def _as_str(series):
+    # Labels as an object array of str. Only cast when needed: object/string columns read from CSV
+    # are already strings, apart from missing values, which become MISSING_LABEL.
+    if pd.api.types.is_string_dtype(series):  # for object columns this checks every value is a str
+        values = series.to_numpy(dtype=object)
+    else:
+        values = series.astype(str).to_numpy(dtype=object)
+    missing = pd.isna(values)
+    if missing.any():
+        values = values.copy()
+        values[missing] = MISSING_LABEL
+    return values
+
+
+def load_pipeline(path):
+    # Accept a saved FeaturePipeline, the legacy dict of LabelEncoders, or a model registry version
+    if os.path.isdir(path):
+        from model_registry import load_version  # the registry imports this module
+        return load_version(path).pipeline
+    obj = joblib.load(path)
+    if isinstance(obj, FeaturePipeline):
+        return obj
+    return FeaturePipeline.from_label_encoders(obj)
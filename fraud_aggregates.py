@@ -0,0 +1,142 @@
+import hashlib
+import io
+import os
+import threading
+
+import joblib
+import pandas as pd
+
+from date_features import calendar_parts, parse_datetimes
+from dataset import DATASET_PATH, file_version, load_dataset, read_dataset
+
+# Dimensions the dashboard charts group by
+CATEGORY_DIMENSIONS = ['state', 'city', 'category']
+TIME_DIMENSIONS = ['year', 'month', 'day', 'weekday', 'hour']
+DIMENSIONS = CATEGORY_DIMENSIONS + TIME_DIMENSIONS
+
+# Block size used to hash the already aggregated part of the file, which must be unchanged for an
+# append-only update
+HASH_BLOCK_BYTES = 1024 * 1024
+
+# path -> FraudAggregates, shared by every session in the process
+_cache = {}
+_lock = threading.Lock()
+
+
+def _dimension_keys(df):
+    parts, valid = calendar_parts(parse_datetimes(df['trans_date_trans_time']))
+    keys = {dim: df[dim] for dim in CATEGORY_DIMENSIONS}
+    # Nullable ints keep bucket labels as 2019, not 2019.0, when some timestamps are missing
+    keys.update({dim: pd.Series(pd.arrays.IntegerArray(parts[dim].astype('int64'), ~valid), index=df.index)
+                 for dim in TIME_DIMENSIONS})
+    return keys
+
+
+class FraudAggregates:
+    # Count, fraud count and amount sum per value of every dimension in DIMENSIONS
+
+    def __init__(self):
+        self.tables = {}
+        self.rows = 0
+        self.version = None  # (mtime_ns, size) of the file the cube reflects
+        self.offset = 0  # bytes of the CSV already aggregated
+        self.prefix_digest = None  # sha1 of the first offset bytes
+
+    def update(self, df):
+        # Fold new rows into the cube; cost depends on len(df), not on the rows seen so far
+        values = pd.DataFrame({
+            'count': 1,
+            'fraud_count': pd.to_numeric(df['is_fraud'], errors='coerce').fillna(0),
+            'amount_sum': df['amt'],
+        }, index=df.index)
+        for dim, keys in _dimension_keys(df).items():
+            agg = values.groupby(keys.rename(dim)).sum()
+            if dim in self.tables:
+                agg = self.tables[dim].add(agg, fill_value=0)
+            self.tables[dim] = agg.sort_index()
+        self.rows += len(df)
+        return self
+
+    def table(self, dim):
+        # Aggregates for one dimension with the fraud rate the charts plot
+        table = self.tables[dim].reset_index()
+        table['fraud_rate'] = table['fraud_count'] / table['count']
+        return table
+
+
+def _prefix_hash(f, offset):
+    # sha1 object fed with the first offset bytes of f, so an append can keep feeding it
+    digest = hashlib.sha1()
+    f.seek(0)
+    remaining = offset
+    while remaining > 0:
+        block = f.read(min(HASH_BLOCK_BYTES, remaining))
+        if not block:
+            break
+        digest.update(block)
+        remaining -= len(block)
+    return digest
+
+
+def _complete_lines_end(f, size):
+    # Offset just past the last newline, so a row that is still being written is left for later
+    f.seek(max(0, size - 1))
+    if f.read(1) == b'\n':
+        return size
+    f.seek(0)
+    return f.read(size).rfind(b'\n') + 1
+
+
+def _append_rows(cube, path, version, prefix):
+    # prefix: the verified hash of the bytes already aggregated, extended here with the new rows
+    with open(path, 'rb') as f:
+        header = f.readline()
+        end = _complete_lines_end(f, version[1])
+        f.seek(cube.offset)
+        data = f.read(end - cube.offset)
+        if data:
+            cube.update(read_dataset(io.BytesIO(header + data)))
+        prefix.update(data)
+        cube.offset = end
+        cube.prefix_digest = prefix.hexdigest()
+    cube.version = version
+    return cube
+
+
+def _rebuild(path, version):
+    cube = FraudAggregates().update(load_dataset(path))
+    with open(path, 'rb') as f:
+        cube.offset = version[1]
+        cube.prefix_digest = _prefix_hash(f, cube.offset).hexdigest()
+    cube.version = version
+    return cube
+
+
+def _verified_prefix(cube, path, version):
+    # The prefix hash when the file strictly grew and every byte already aggregated is unchanged
+    # (so only appended rows need reading); None when the cube must be rebuilt. A rewrite in place
+    # that keeps the size, e.g. relabelled rows, is a rebuild.
+    if cube is None or cube.version is None or version[1] <= cube.version[1] or version[1] < cube.offset:
+        return None
+    with open(path, 'rb') as f:
+        prefix = _prefix_hash(f, cube.offset)
+    return prefix if prefix.hexdigest() == getattr(cube, 'prefix_digest', None) else None
+
+
+def load_aggregates(path=DATASET_PATH):
+    # Cube for the current version of path: reused, updated with appended rows, or rebuilt
+    version = file_version(path)
+    cache_path = f"{path}.aggregates.pkl"
+    with _lock:
+        cube = _cache.get(path)
+        if cube is None and os.path.exists(cache_path):
+            cube = joblib.load(cache_path)
+        if cube is None or cube.version != version:
+            prefix = _verified_prefix(cube, path, version)
+            if prefix is not None:
+                cube = _append_rows(cube, path, version, prefix)
+            else:
+                cube = _rebuild(path, version)
+            joblib.dump(cube, cache_path)
+        _cache[path] = cube
+        return cube
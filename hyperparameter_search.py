@@ -0,0 +1,174 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+
+import joblib
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+from imblearn.over_sampling import SMOTE
+from sklearn.ensemble import IsolationForest
+from sklearn.metrics import confusion_matrix
+from sklearn.model_selection import StratifiedKFold, TimeSeriesSplit
+
+from columnar_store import read_transactions
+from compiled_forest import compile_forest
+from dataset import file_version
+from date_features import parse_datetimes
+from detect_fraud_isolate import score_transactions as score_isolation_forest
+from detect_fraud_xgboost import score_transactions as score_xgboost
+from feature_pipeline import FeaturePipeline
+from velocity_store import VelocityStore
+
+# Candidate values per model; every combination is evaluated on every fold
+PARAM_GRIDS = {
+    "isolation_forest": {
+        'n_estimators': [100, 250, 500],
+        'contamination': [0.002, 0.005, 0.01],
+        'max_samples': [256, 1024],
+    },
+    "xgboost": {
+        'n_estimators': [100, 200, 400],
+        'learning_rate': [0.05, 0.1],
+        'max_depth': [4, 6, 8],
+    },
+}
+
+# Preprocessed folds are kept here, one directory per model, and reused while the data is unchanged
+CACHE_DIR = "search_cache"
+
+# Per-process fold arrays, opened once by _init_worker
+_worker = {}
+
+
+def param_grid(model_name):
+    grid = PARAM_GRIDS[model_name]
+    return [dict(zip(grid, values)) for values in product(*grid.values())]
+
+
+def _fold_indices(df, y, n_folds, split):
+    # Stratified folds keep the fraud rate per fold; time folds always test on later transactions
+    if split == "time":
+        order = np.argsort(parse_datetimes(df['trans_date_trans_time']), kind='stable')
+        return [(order[train], order[test]) for train, test in TimeSeriesSplit(n_folds).split(order)]
+    return list(StratifiedKFold(n_folds, shuffle=True, random_state=42).split(np.zeros(len(y)), y))
+
+
+def prepare_folds(model_name, data_path, n_folds=3, split="stratified", include_distance=False,
+                  include_velocity=False, cache_dir=CACHE_DIR):
+    # Preprocess once and write every fold's train/test matrices as .npy files for memory mapping
+    fold_dir = os.path.join(cache_dir, model_name)
+    key = (file_version(data_path), os.path.abspath(data_path), n_folds, split, include_distance, include_velocity)
+    key_path = os.path.join(fold_dir, "key.pkl")
+    if os.path.exists(key_path) and joblib.load(key_path) == key:
+        return fold_dir
+
+    os.makedirs(fold_dir, exist_ok=True)
+    df = read_transactions(data_path)
+    velocity_store = VelocityStore() if include_velocity else None
+    X = FeaturePipeline(include_distance, include_velocity).fit_transform(df, velocity_store)
+    y = df['is_fraud'].to_numpy(dtype=np.int8)
+
+    for k, (train, test) in enumerate(_fold_indices(df, y, n_folds, split)):
+        X_train, y_train = X[train], y[train]
+        if model_name == "xgboost":
+            # Resample each training fold once here instead of in every trial
+            X_train, y_train = SMOTE(sampling_strategy='auto', random_state=42).fit_resample(X_train, y_train)
+        for name, array in (("X_train", X_train), ("y_train", y_train), ("X_test", X[test]), ("y_test", y[test])):
+            np.save(os.path.join(fold_dir, f"fold{k}_{name}.npy"), np.ascontiguousarray(array))
+    joblib.dump(key, key_path)  # written last, so an interrupted run is redone
+    return fold_dir
+
+
+def _init_worker(fold_dir, n_folds):
+    # Map the cached folds read-only; the pages are shared by every worker through the OS cache
+    _worker['folds'] = [
+        {name: np.load(os.path.join(fold_dir, f"fold{k}_{name}.npy"), mmap_mode='r')
+         for name in ("X_train", "y_train", "X_test", "y_test")}
+        for k in range(n_folds)
+    ]
+
+
+def _fit(model_name, params, X, y):
+    # One thread per trial; the process pool provides the parallelism
+    if model_name == "xgboost":
+        model = xgb.XGBClassifier(**params, tree_method='hist', n_jobs=1, random_state=42, eval_metric='logloss')
+        return model.fit(X, y)
+    return compile_forest(IsolationForest(**params, random_state=42).fit(X))
+
+
+def _run_trial(model_name, params, k):
+    fold = _worker['folds'][k]
+    start = time.perf_counter()
+    model = _fit(model_name, params, fold['X_train'], fold['y_train'])
+    fit_seconds = time.perf_counter() - start
+
+    # Scored through the same functions the batch scripts and the service use
+    score_fn = score_xgboost if model_name == "xgboost" else score_isolation_forest
+    start = time.perf_counter()
+    _, is_fraud = score_fn(model, fold['X_test'])
+    predict_seconds = time.perf_counter() - start
+
+    counts = confusion_matrix(fold['y_test'], is_fraud.astype(np.int8), labels=[0, 1]).ravel()
+    return fit_seconds, predict_seconds, len(is_fraud), counts
+
+
+def _pareto(results):
+    # Configs no other config beats on both F1 and prediction latency
+    f1, latency = results['f1'].to_numpy(), results['predict_us_per_row'].to_numpy()
+    dominated = [((f1 >= f) & (latency <= t) & ((f1 > f) | (latency < t))).any() for f, t in zip(f1, latency)]
+    return ~np.array(dominated, dtype=bool)
+
+
+def search(model_name, data_path="credit_card_fraud.csv", n_folds=3, split="stratified", workers=None,
+           include_distance=False, include_velocity=False, cache_dir=CACHE_DIR):
+    # Evaluate every config of PARAM_GRIDS[model_name] on every fold in a process pool
+    start = time.perf_counter()
+    fold_dir = prepare_folds(model_name, data_path, n_folds, split, include_distance, include_velocity, cache_dir)
+    print(f"✅ Folds ready in {fold_dir} ({time.perf_counter() - start:.1f}s)")
+
+    configs = param_grid(model_name)
+    trials = [(i, k) for i in range(len(configs)) for k in range(n_folds)]
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), initializer=_init_worker,
+                             initargs=(fold_dir, n_folds)) as pool:
+        outcomes = list(pool.map(_run_trial, [model_name] * len(trials), [configs[i] for i, _ in trials],
+                                 [k for _, k in trials]))
+
+    rows = []
+    for i, params in enumerate(configs):
+        runs = [outcome for (c, _), outcome in zip(trials, outcomes) if c == i]
+        tn, fp, fn, tp = np.sum([counts for *_, counts in runs], axis=0)
+        precision = tp / (tp + fp) if tp + fp else 0.0
+        recall = tp / (tp + fn) if tp + fn else 0.0
+        rows.append({
+            **params,
+            'precision': precision,
+            'recall': recall,
+            'f1': 2 * precision * recall / (precision + recall) if precision + recall else 0.0,
+            'fit_seconds': np.mean([fit for fit, *_ in runs]),
+            'predict_us_per_row': 1e6 * sum(run[1] for run in runs) / sum(run[2] for run in runs),
+        })
+    results = pd.DataFrame(rows)
+    results['pareto'] = _pareto(results)
+    return results.sort_values(['f1', 'predict_us_per_row'], ascending=[False, True], ignore_index=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cross-validated hyperparameter search for the fraud models")
+    parser.add_argument("model", choices=sorted(PARAM_GRIDS))
+    parser.add_argument("--data", default="credit_card_fraud.csv", help="CSV, Parquet or Arrow training data")
+    parser.add_argument("--folds", type=int, default=3)
+    parser.add_argument("--split", choices=["stratified", "time"], default="stratified",
+                        help="Stratified K-fold, or folds that always test on later transactions")
+    parser.add_argument("--workers", type=int, default=None, help="Trials run in this many processes")
+    parser.add_argument("--distance", action="store_true", help="Add customer-merchant distance as a feature")
+    parser.add_argument("--velocity", action="store_true", help="Add per-customer 1h/24h/7d velocity features")
+    parser.add_argument("--output", default=None, help="Write the results table to this CSV file")
+    args = parser.parse_args()
+    results = search(args.model, args.data, args.folds, args.split, args.workers, args.distance, args.velocity)
+    print(results.to_string(index=False, float_format=lambda v: f"{v:.4f}"))
+    if args.output:
+        results.to_csv(args.output, index=False)
+        print(f"✅ Results saved to {args.output}")
@@ -1,69 +1,63 @@
-import pandas as pd
-from sklearn.preprocessing import LabelEncoder
+import argparse
 from sklearn.ensemble import IsolationForest
 import joblib
-from sklearn.metrics import confusion_matrix
+from columnar_store import read_transactions
+from feature_pipeline import FeaturePipeline
+from velocity_store import VelocityStore
+from model_registry import publish
+from stage_metrics import METRICS_DIR, StageMetrics, profiled, stage
 
+# Isolation Forest settings, shared with the benchmark suite
+MODEL_PARAMS = {'n_estimators': 500, 'contamination': 0.005, 'random_state': 42}
 
-# Function to preprocess data, including label encoding and handling unseen labels
-def preprocess_data(df, label_encoders=None):
-    # Drop unnecessary columns
-    df = df.drop(columns=['trans_num', 'merchant','is_fraud'], errors='ignore')  # Avoid errors if columns are not present
 
-    # Convert 'dob' column (if present) to datetime, and extract relevant features
-    if 'dob' in df.columns:
-        df['dob'] = pd.to_datetime(df['dob'], errors='coerce')  # Convert to datetime, errors='coerce' will turn invalid dates into NaT
-        df['dob_year'] = df['dob'].dt.year
-        df['dob_month'] = df['dob'].dt.month
-        df['dob_day'] = df['dob'].dt.day
-        df = df.drop(columns=['dob'])  # Drop original 'dob' column
+def fit_isolation_forest(X):
+    return IsolationForest(**MODEL_PARAMS).fit(X)
 
-    # Convert 'trans_date_trans_time' to datetime and extract features
-    df['trans_date_trans_time'] = pd.to_datetime(df['trans_date_trans_time'], errors='coerce')  # Handling invalid dates
-    df['hour'] = df['trans_date_trans_time'].dt.hour
-    df['day'] = df['trans_date_trans_time'].dt.day
-    df['month'] = df['trans_date_trans_time'].dt.month
-    df = df.drop(columns=['trans_date_trans_time'])  # Drop original date column
 
-    # Encode categorical variables
-    label_encoders = label_encoders or {}  # If no label encoders provided, initialize an empty dictionary
-    categorical_cols = ['category', 'state', 'job', 'city']
-
-    for col in categorical_cols:
-        le = label_encoders.get(col, LabelEncoder())  # Get existing encoder or create a new one
-        if col not in label_encoders:  # Fit encoder only if not done before (for training data)
-            le.fit(df[col].astype(str))  # Fit on training data
-            label_encoders[col] = le  # Save encoder for future use
-
-        # Transform with handling for unseen labels
-        df[col] = df[col].astype(str)  # Ensure all values are strings
-        # Handle unseen labels by replacing with the most frequent value
-        df[col] = le.transform(df[col].where(df[col].isin(le.classes_), le.classes_[0]))
-
-    # Check for missing values after conversion and handle them if any
-    df = df.fillna(0)  # Fill missing values with 0 or other appropriate values
-
-    return df, label_encoders
-
-def train_model():
+def train_model(include_distance=False, data_path="credit_card_fraud.csv", include_velocity=False):
     # Load real transactions
-    df_real = pd.read_csv("credit_card_fraud.csv")
+    with stage("load") as record:
+        df_real = read_transactions(data_path)
+        record['rows'] = len(df_real)
 
-    # Preprocess data
-    df_train, label_encoders = preprocess_data(df_real)
+    # Preprocess data (velocity features replay the history through a fresh store)
+    with stage("preprocess", len(df_real)):
+        velocity_store = VelocityStore() if include_velocity else None
+        pipeline = FeaturePipeline(include_distance, include_velocity).fit(df_real)
+        df_train = pipeline.transform_frame(df_real, velocity_store)
 
     # Train Isolation Forest
-    model = IsolationForest(n_estimators=500, contamination=0.005, random_state=42)
-    model.fit(df_train)
+    with stage("fit", len(df_train)):
+        model = fit_isolation_forest(df_train)
+
+    # Save trained model and feature pipeline
+    with stage("save"):
+        joblib.dump(model, "isolation_forest.pkl")
+        joblib.dump(pipeline, "label_encoders.pkl")
+        if velocity_store is not None:
+            velocity_store.save("velocity_store.pkl")
 
-    # Save trained model and label encoders
-    joblib.dump(model, "isolation_forest.pkl")
-    joblib.dump(label_encoders, "label_encoders.pkl")
+        # Versioned copy with a manifest, memory-mapped by the app and the scoring service
+        version_dir = publish("isolation_forest", model, pipeline, data_path,
+                              metrics={'train_rows': len(df_train), 'offset': float(model.offset_)},
+                              params=model.get_params())
 
-    print("✅ Model trained and saved!")
+    print(f"✅ Model trained and saved! (registry: {version_dir})")
 #
 # Run the training function
-train_model()
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the Isolation Forest model")
+    parser.add_argument("--distance", action="store_true", help="Add customer-merchant distance as a feature")
+    parser.add_argument("--data", default="credit_card_fraud.csv", help="CSV, Parquet or Arrow training data")
+    parser.add_argument("--velocity", action="store_true", help="Add per-customer 1h/24h/7d velocity features")
+    parser.add_argument("--metrics-dir", default=METRICS_DIR, help="Where the JSON log and Prometheus file go")
+    parser.add_argument("--profile", default=None, help="Also run under cProfile and save the stats to this file")
+    args = parser.parse_args()
+    with StageMetrics("train_isolation_forest") as run, profiled(args.profile):
+        train_model(args.distance, args.data, args.velocity)
+    run.print_report()
+    print(f"✅ Stage metrics saved to {run.save(args.metrics_dir)}")
 
 # Train Isolation Forest
 # def train_isolation_forest():
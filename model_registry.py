@@ -0,0 +1,155 @@
+import datetime
+import functools
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+import joblib
+
+from compiled_forest import compile_forest, load_forest_arrays, load_isolation_forest
+from feature_pipeline import load_pipeline, load_pipeline_arrays
+
+# Published models live in REGISTRY_DIR/<name>/v<N>/; REGISTRY_DIR/<name>/CURRENT names the live version
+REGISTRY_DIR = "models"
+MANIFEST_NAME = "manifest.json"
+CURRENT_NAME = "CURRENT"
+
+# Files the trainers wrote before the registry existed: model, encoders, velocity snapshot.
+# They are still used when a model has never been published; velocity snapshots always live here.
+LEGACY_FILES = {
+    "isolation_forest": ("isolation_forest.pkl", "label_encoders.pkl", "velocity_store.pkl"),
+    "xgboost": ("xgboost_model.pkl", "label_encoders_xgboost.pkl", "velocity_store_xgboost.pkl"),
+}
+
+# name -> (version directory, RegisteredModel), shared by every caller in the process
+_cache = {}
+_lock = threading.Lock()
+
+
+class RegisteredModel:
+    # A loaded model with its feature pipeline, manifest and the paths worker processes reload it from
+
+    def __init__(self, name, model, pipeline, manifest, model_path, pipeline_path, load_model):
+        self.name = name
+        self.model = model
+        self.pipeline = pipeline
+        self.manifest = manifest  # None for legacy pickles
+        self.model_path = model_path
+        self.pipeline_path = pipeline_path
+        self.load_model = load_model  # picklable loader for batch_scoring's process pools
+        self.velocity_path = LEGACY_FILES[name][2]
+
+    @functools.cached_property
+    def version(self):
+        return f"v{self.manifest['version']}" if self.manifest else file_model_version(self.model_path)
+
+    @property
+    def model_version(self):
+        # "<name>/<version>", the label written with predictions and the prediction cache's key
+        return f"{self.name}/{self.version}"
+
+
+def file_sha256(path, block_size=1 << 20):
+    # Content hash of the training data, read in blocks so large files are never loaded whole
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def file_model_version(path):
+    # Version label of a model that was never published: a prefix of the model file's content hash
+    return f"sha256:{file_sha256(path)[:12]}"
+
+
+def _write_atomic(path, text):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def publish(name, model, pipeline, data_path=None, metrics=None, params=None, registry_dir=REGISTRY_DIR):
+    # Store a trained model as the next version of name and make it the current one
+    model_dir = os.path.join(registry_dir, name)
+    os.makedirs(model_dir, exist_ok=True)
+    versions = [int(v[1:]) for v in os.listdir(model_dir) if v.startswith('v') and v[1:].isdigit()]
+    version = max(versions, default=0) + 1
+
+    # Written into a staging directory first, so readers never see a half-written version
+    staging = tempfile.mkdtemp(prefix=".staging-", dir=model_dir)
+    manifest = {
+        'name': name,
+        'version': version,
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'feature_names': list(pipeline.feature_names),
+        'pipeline': pipeline.save_arrays(staging),
+        'training_data': None if data_path is None else {
+            'path': os.path.basename(data_path),
+            'sha256': file_sha256(data_path),
+        },
+        'metrics': metrics or {},
+        'params': params or {},
+    }
+    if hasattr(model, 'get_booster'):
+        model.save_model(os.path.join(staging, "model.ubj"))  # XGBoost's native binary format
+        manifest['format'] = "xgboost-ubj"
+    else:
+        manifest['format'] = "forest-npy"
+        manifest['forest'] = compile_forest(model).save_arrays(staging)
+    with open(os.path.join(staging, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2, default=str)
+
+    version_dir = os.path.join(model_dir, f"v{version}")
+    os.chmod(staging, 0o755)  # mkdtemp's 0700 would hide the version from services running as other users
+    os.rename(staging, version_dir)
+    _write_atomic(os.path.join(model_dir, CURRENT_NAME), f"v{version}\n")
+    return version_dir
+
+
+def current_version_dir(name, registry_dir=REGISTRY_DIR):
+    current_path = os.path.join(registry_dir, name, CURRENT_NAME)
+    if not os.path.exists(current_path):
+        return None
+    with open(current_path) as f:
+        return os.path.join(registry_dir, name, f.read().strip())
+
+
+def load_version(version_dir, mmap_mode='r'):
+    # Forest nodes and encoder labels are memory-mapped read-only, so every process that
+    # loads the same version shares one copy of them in the page cache
+    with open(os.path.join(version_dir, MANIFEST_NAME)) as f:
+        manifest = json.load(f)
+    pipeline = load_pipeline_arrays(version_dir, manifest['pipeline'])
+    if manifest['format'] == "xgboost-ubj":
+        import xgboost as xgb  # only needed for XGBoost versions
+        model = xgb.XGBClassifier()
+        model.load_model(os.path.join(version_dir, "model.ubj"))
+    else:
+        model = load_forest_arrays(version_dir, manifest['forest'], mmap_mode)
+    return RegisteredModel(manifest['name'], model, pipeline, manifest, version_dir, version_dir,
+                           load_registered_model)
+
+
+def load_registered_model(version_dir):
+    return load_version(version_dir).model
+
+
+def _load_legacy(name):
+    model_path, pipeline_path, _ = LEGACY_FILES[name]
+    load_model = load_isolation_forest if name == "isolation_forest" else joblib.load
+    return RegisteredModel(name, load_model(model_path), load_pipeline(pipeline_path), None,
+                           model_path, pipeline_path, load_model)
+
+
+def load_model(name, registry_dir=REGISTRY_DIR):
+    # Current version of name, loaded on first use and reused until a newer version is published
+    version_dir = current_version_dir(name, registry_dir)
+    with _lock:
+        cached = _cache.get(name)
+        if cached is None or cached[0] != version_dir:
+            _cache[name] = (version_dir, load_version(version_dir) if version_dir else _load_legacy(name))
+        return _cache[name][1]
@@ -0,0 +1,253 @@
+import argparse
+import atexit
+import hashlib
+import os
+import threading
+import time
+from contextlib import nullcontext
+from itertools import repeat
+
+import numpy as np
+import pandas as pd
+
+from stage_metrics import stage
+
+# Default cache file, shared by the scoring scripts, the service and the app
+PREDICTION_CACHE_PATH = "prediction_cache.npz"
+
+# Entries kept before the least recently used are evicted, and the fraction of it eviction goes down to
+# (so a full cache isn't trimmed again on every merge); about 33 bytes per entry in memory and on disk
+MAX_ENTRIES = 2_000_000
+EVICT_TO = 0.9
+
+# New entries are buffered in a dict and merged into the sorted arrays in bulk once there are this many;
+# lookups of batches at least this large merge the buffer first
+MERGE_ROWS = 10_000
+
+# Long-lived processes (service, app) write the cache back at most this often
+SAVE_SECONDS = 300
+
+# Arrays of the cache file, sorted by 'key' (64-bit hash of model version and trans_num)
+COLUMNS = {'key': np.uint64, 'score': np.float64, 'is_fraud': bool, 'created': np.int64, 'last_used': np.int64}
+
+# path -> PredictionCache, shared by every caller in the process (e.g. all Streamlit sessions)
+_cache = {}
+_lock = threading.Lock()
+
+
+def _file_version(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _hash_keys(model_version, trans_nums):
+    # The model version picks the SipHash key, so equal trans_nums of different versions hash apart.
+    # A false hit needs a 64-bit collision: about n / 2**64 per lookup against n entries.
+    hash_key = hashlib.md5(model_version.encode()).hexdigest()[:16]
+    return pd.util.hash_array(trans_nums, hash_key=hash_key, categorize=False)
+
+
+def _combine(base, new):
+    # Both sets of entries in key order; entries of new replace equal keys of base
+    merged = {col: np.concatenate([base[col], new[col]]) for col in COLUMNS}
+    order = np.argsort(merged['key'], kind='stable')
+    merged = {col: values[order] for col, values in merged.items()}
+    last = np.append(merged['key'][1:] != merged['key'][:-1], True)
+    return {col: values[last] for col, values in merged.items()}
+
+
+class PredictionCache:
+    # Persistent, size-bounded LRU of (model version, trans_num) -> (score, is_fraud). Entries live in
+    # memory as arrays sorted by key hash, so a batch is looked up with one vectorized searchsorted;
+    # save() writes them back to one .npz file, merged with whatever other processes saved meanwhile.
+    # Entries older than ttl_seconds (when set) count as misses and are dropped at the next merge.
+
+    def __init__(self, path=PREDICTION_CACHE_PATH, max_entries=MAX_ENTRIES, ttl_seconds=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = self._read()
+        self._pending = {}  # key -> (score, is_fraud, created), not merged into _entries yet
+        self._version = _file_version(path)
+        self._saved_at = time.time()
+        self._dirty = False
+
+    def _read(self):
+        if _file_version(self.path) is None:
+            return {col: np.empty(0, dtype=dtype) for col, dtype in COLUMNS.items()}
+        with np.load(self.path) as data:
+            return {col: data[col] for col in COLUMNS}
+
+    def __len__(self):
+        return len(self._entries['key']) + len(self._pending)
+
+    def lookup(self, model_version, trans_nums):
+        # (scores, is_fraud, hit) for each trans_num; scores are NaN where hit is False
+        keys = np.asarray(trans_nums, dtype=object)
+        valid = pd.notna(keys)
+        hashes = _hash_keys(model_version, keys)
+        scores = np.full(len(keys), np.nan)
+        is_fraud = np.zeros(len(keys), dtype=bool)
+        hit = np.zeros(len(keys), dtype=bool)
+        now = int(time.time())
+        oldest = now - self.ttl_seconds if self.ttl_seconds else None
+        with self._lock:
+            if self._pending and len(keys) >= MERGE_ROWS:
+                self._merge(now)
+            entries = self._entries
+            if len(entries['key']):
+                order = np.argsort(hashes)  # sorted queries walk the table in order
+                pos = np.empty(len(keys), dtype=np.intp)
+                pos[order] = np.searchsorted(entries['key'], hashes[order])
+                pos = np.minimum(pos, len(entries['key']) - 1)
+                hit = valid & (entries['key'][pos] == hashes)
+                if oldest is not None:
+                    hit &= entries['created'][pos] >= oldest
+                found = pos[hit]
+                scores[hit] = entries['score'][found]
+                is_fraud[hit] = entries['is_fraud'][found]
+                entries['last_used'][found] = now
+            if self._pending:
+                for i in np.flatnonzero(valid & ~hit):
+                    entry = self._pending.get(int(hashes[i]))
+                    if entry is not None and (oldest is None or entry[2] >= oldest):
+                        scores[i], is_fraud[i], _ = entry
+                        hit[i] = True
+            n_hits = int(hit.sum())
+            self.hits += n_hits
+            self.misses += len(keys) - n_hits
+        return scores, is_fraud, hit
+
+    def store(self, model_version, trans_nums, scores, is_fraud):
+        # Insert or refresh predictions; rows without a trans_num are skipped
+        keys = np.asarray(trans_nums, dtype=object)
+        valid = pd.notna(keys)
+        hashes = _hash_keys(model_version, keys[valid])
+        scores = np.asarray(scores, dtype=np.float64)[valid]
+        is_fraud = np.asarray(is_fraud, dtype=bool)[valid]
+        now = int(time.time())
+        with self._lock:
+            self._dirty = True
+            if len(self._pending) + len(hashes) < MERGE_ROWS:
+                self._pending.update(zip(hashes.tolist(), zip(scores.tolist(), is_fraud.tolist(), repeat(now))))
+            else:
+                self._merge(now, {'key': hashes, 'score': scores, 'is_fraud': is_fraud,
+                                  'created': np.full(len(hashes), now), 'last_used': np.full(len(hashes), now)})
+        if time.time() - self._saved_at >= SAVE_SECONDS:
+            self.save()
+
+    def _merge(self, now, new=None):
+        # Fold the buffered entries (and new, if given) into the sorted arrays, then evict
+        if self._pending:
+            pending = np.array(list(self._pending.values()), dtype=np.float64).reshape(-1, 3)
+            buffered = {'key': np.fromiter(self._pending, dtype=np.uint64, count=len(self._pending)),
+                        'score': pending[:, 0], 'is_fraud': pending[:, 1].astype(bool),
+                        'created': pending[:, 2].astype(np.int64), 'last_used': pending[:, 2].astype(np.int64)}
+            new = buffered if new is None else _combine(buffered, new)
+            self._pending = {}
+        if new is not None:
+            self._entries = self._evict(_combine(self._entries, new), now)
+
+    def _evict(self, entries, now):
+        # Drop expired entries, then the least recently used down to EVICT_TO of max_entries
+        keep = np.ones(len(entries['key']), dtype=bool)
+        if self.ttl_seconds:
+            keep &= entries['created'] >= now - self.ttl_seconds
+        if keep.sum() > self.max_entries:
+            candidates = np.flatnonzero(keep)
+            recent = candidates[np.argsort(-entries['last_used'][candidates], kind='stable')]
+            keep[:] = False
+            keep[recent[:int(self.max_entries * EVICT_TO)]] = True
+        if keep.all():
+            return entries
+        return {col: values[keep] for col, values in entries.items()}
+
+    def save(self):
+        # Atomic rewrite of the cache file; entries another process saved since our last read or save are kept
+        with self._lock:
+            now = int(time.time())
+            self._merge(now)
+            if _file_version(self.path) != self._version:
+                self._entries = self._evict(_combine(self._read(), self._entries), now)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, **self._entries)
+            os.replace(tmp_path, self.path)
+            self._version = _file_version(self.path)
+            self._saved_at = time.time()
+            self._dirty = False
+
+    def close(self):
+        if self._dirty:
+            self.save()
+
+    def summary(self):
+        lookups = self.hits + self.misses
+        return {"size": len(self), "hits": self.hits, "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_cache(path=None):
+    # For the scripts' with-blocks: the cache at path, saved on exit; None when path is None
+    return PredictionCache(path) if path else nullcontext()
+
+
+def shared_cache(path=PREDICTION_CACHE_PATH):
+    # One cache per file and process, saved when the process exits
+    with _lock:
+        if path not in _cache:
+            _cache[path] = PredictionCache(path)
+            atexit.register(_cache[path].close)
+        return _cache[path]
+
+
+def predict_cached(df, predict, cache, model_version):
+    # predict(frame) -> (scores, is_fraud) runs only on the rows of df whose (model_version, trans_num)
+    # isn't cached, once per trans_num, and its predictions are stored. Rows without a trans_num are
+    # always predicted. Cached or not, scores come back as float64.
+    if cache is None or 'trans_num' not in df.columns:
+        return predict(df)
+    keys = df['trans_num'].to_numpy(dtype=object)
+    with stage("cache_lookup", len(df)):
+        scores, is_fraud, hit = cache.lookup(model_version, keys)
+    valid = pd.notna(keys)
+    # Later rows repeating a trans_num that is about to be scored reuse its prediction
+    repeated = pd.Series(keys).where(~hit & valid).duplicated().to_numpy() & ~hit & valid
+    todo = ~hit & ~repeated
+    if todo.any():
+        new_scores, new_flags = predict(df[todo])
+        scores[todo] = new_scores
+        is_fraud[todo] = new_flags
+        with stage("cache_store", int(todo.sum())):
+            cache.store(model_version, keys[todo], new_scores, new_flags)
+        if repeated.any():
+            first = np.flatnonzero(todo & valid)
+            source = first[pd.Index(keys[first]).get_indexer(keys[repeated])]
+            scores[repeated] = scores[source]
+            is_fraud[repeated] = is_fraud[source]
+    return scores, is_fraud
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or clear the prediction cache")
+    parser.add_argument("--path", default=PREDICTION_CACHE_PATH)
+    parser.add_argument("--clear", action="store_true", help="Delete the cache file")
+    args = parser.parse_args()
+    if args.clear:
+        if os.path.exists(args.path):
+            os.remove(args.path)
+        print(f"✅ Cleared {args.path}")
+    else:
+        print(f"✅ {len(PredictionCache(args.path)):,} cached predictions in {args.path}")
@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+
+# Rows per page the viewer offers; only one page is ever sent to the browser
+PAGE_SIZES = [50, 100, 500, 1000]
+
+# Columns whose values can be picked in the filters, when the frame has them
+FILTER_COLUMNS = ['category', 'state']
+
+
+def _sort_key(values):
+    # Numeric and datetime columns sort by value (NaN/NaT last); anything else by its rank among the sorted distinct values
+    if pd.api.types.is_datetime64_any_dtype(values):
+        stamps = values.to_numpy(dtype='datetime64[s]')
+        return np.where(np.isnat(stamps), np.nan, stamps.astype(np.int64))
+    if pd.api.types.is_numeric_dtype(values):
+        return values.to_numpy(dtype=np.float64, na_value=np.nan)
+    codes, _ = pd.factorize(values, sort=True)
+    return np.where(codes < 0, np.nan, codes)
+
+
+class ResultView:
+    # A large (scored) frame kept server-side for one upload. Summary counts are computed once, filters
+    # are boolean masks over the whole frame and each column's sort order is computed once, so a rerun
+    # that changes a filter, the sort or the page costs a few vectorized passes, and the browser only
+    # receives page_size rows.
+
+    def __init__(self, df, flagged=None):
+        self.df = df
+        self.flagged = None if flagged is None else np.asarray(flagged, dtype=bool)
+        self.scores = df['score'].to_numpy(dtype=np.float64) if 'score' in df.columns else None
+        # column -> (codes, values); code -1 is missing
+        self.values = {col: pd.factorize(df[col], sort=True) for col in FILTER_COLUMNS if col in df.columns}
+        self.summary = self._summarize()
+        self._orders = {}  # (column, ascending) -> row order of the whole frame
+        self._last = None  # (query, rows) of the last filter, reused while only the page changes
+
+    def _summarize(self):
+        summary = {'rows': len(self.df)}
+        if self.flagged is not None:
+            summary['flagged'] = int(self.flagged.sum())
+        if self.scores is not None and len(self.scores):
+            summary['score_range'] = (float(np.nanmin(self.scores)), float(np.nanmax(self.scores)))
+        # Rows (and flagged rows) per filter value, largest first
+        for col, (codes, values) in self.values.items():
+            known = codes >= 0
+            table = pd.DataFrame({col: values, 'rows': np.bincount(codes[known], minlength=len(values))})
+            if self.flagged is not None:
+                table['flagged'] = np.bincount(codes[known], weights=self.flagged[known], minlength=len(values)).astype(int)
+            summary[col] = table.sort_values('rows', ascending=False, kind='stable').reset_index(drop=True)
+        return summary
+
+    def _order(self, column, ascending):
+        key = (column, ascending)
+        if key not in self._orders:
+            values = _sort_key(self.df[column])
+            # Negating keeps the sort stable and NaN last in both directions
+            self._orders[key] = np.argsort(values if ascending else -values, kind='stable')
+        return self._orders[key]
+
+    def filter(self, fraud_only=False, score_range=None, selected=None, sort_by=None, ascending=True):
+        # Positions of the matching rows, in sort_by order (file order when None).
+        # selected maps a FILTER_COLUMNS column to the values to keep; an empty selection keeps all.
+        query = (fraud_only, score_range, tuple((col, tuple(v)) for col, v in (selected or {}).items()),
+                 sort_by, ascending)
+        if self._last is not None and self._last[0] == query:
+            return self._last[1]
+        mask = np.ones(len(self.df), dtype=bool)
+        if fraud_only and self.flagged is not None:
+            mask &= self.flagged
+        if score_range is not None and self.scores is not None:
+            low, high = score_range
+            mask &= (self.scores >= low) & (self.scores <= high)
+        for col, keep in (selected or {}).items():
+            if keep and col in self.values:
+                codes, values = self.values[col]
+                allowed = np.append(pd.Index(values).isin(keep), False)  # the extra slot is code -1
+                mask &= allowed[codes]
+        if sort_by is None:
+            rows = np.flatnonzero(mask)
+        else:
+            order = self._order(sort_by, ascending)
+            rows = order[mask[order]]
+        self._last = (query, rows)
+        return rows
+
+    def page(self, rows, number, page_size):
+        # Rows of page number (0-based) of a filter() result
+        return self.df.iloc[rows[number * page_size:(number + 1) * page_size]]
@@ -0,0 +1,290 @@
+import argparse
+import datetime
+import json
+import math
+import queue
+import threading
+import time
+from collections import deque
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+from customer_index import customer_keys
+from date_features import DATE_FORMAT, DATETIME_FORMAT, DateCache
+from feature_pipeline import CATEGORICAL_COLS, NUMERIC_COLS
+from velocity_store import load_velocity_store
+from model_registry import load_model
+from detect_fraud_isolate import score_transactions as score_isolation_forest
+from detect_fraud_xgboost import (DEFAULT_THRESHOLD, cache_key as xgboost_cache_key,
+                                  score_transactions as score_xgboost)
+from prediction_cache import PREDICTION_CACHE_PATH, PredictionCache, predict_cached
+
+# Fields a transaction must carry; a bad record would otherwise fail its whole micro-batch
+REQUIRED_FIELDS = ['trans_date_trans_time'] + CATEGORICAL_COLS + NUMERIC_COLS
+
+# Date fields and their expected formats; dob is optional
+DATE_FIELDS = {'trans_date_trans_time': DATETIME_FORMAT, 'dob': DATE_FORMAT}
+
+# score_transactions(model, features) -> (scores, is_fraud), shared with the batch scripts
+SCORE_FUNCTIONS = {
+    "isolation_forest": score_isolation_forest,
+    "xgboost": score_xgboost,
+}
+
+
+def _parse_date(value, fmt):
+    # Same rule as date_features.parse_datetimes: the fixed format first, pandas' inference otherwise
+    try:
+        return datetime.datetime.strptime(value, fmt)
+    except (TypeError, ValueError):
+        stamp = pd.Timestamp(value)
+        if pd.isna(stamp):
+            raise ValueError
+        return stamp
+
+
+def validate_transaction(transaction):
+    # A copy of transaction with its numeric fields as floats; raises ValueError naming every bad field,
+    # so a bad record is rejected before it can join (and fail) a micro-batch
+    missing = [field for field in REQUIRED_FIELDS if field not in transaction]
+    if missing:
+        raise ValueError(f"missing fields: {', '.join(missing)}")
+    transaction = dict(transaction)
+    errors = []
+    for field in NUMERIC_COLS:
+        value = transaction[field]
+        try:
+            if isinstance(value, bool):
+                raise ValueError
+            transaction[field] = float(value)
+            if not math.isfinite(transaction[field]):
+                raise ValueError
+        except (TypeError, ValueError):
+            errors.append(f"{field} must be a finite number, got {value!r}")
+    for field, fmt in DATE_FIELDS.items():
+        value = transaction.get(field)
+        if value is None and field not in REQUIRED_FIELDS:
+            continue
+        try:
+            _parse_date(value, fmt)
+        except (TypeError, ValueError):
+            errors.append(f"{field} must be a date like {datetime.datetime(2020, 1, 31, 13, 5).strftime(fmt)}, "
+                          f"got {value!r}")
+    if errors:
+        raise ValueError("; ".join(errors))
+    return transaction
+
+
+class LatencyTracker:
+    # Keeps the most recent request latencies (ms) for p50/p99 reporting
+
+    def __init__(self, window=10_000):
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.total_requests = 0
+
+    def record(self, latency_ms):
+        with self._lock:
+            self._latencies.append(latency_ms)
+            self.total_requests += 1
+
+    def summary(self):
+        with self._lock:
+            latencies = np.array(self._latencies)
+            total = self.total_requests
+        if not len(latencies):
+            return {"requests": total, "p50_ms": None, "p99_ms": None}
+        p50, p99 = np.percentile(latencies, [50, 99])
+        return {"requests": total, "p50_ms": round(float(p50), 3), "p99_ms": round(float(p99), 3)}
+
+
+class _Pending:
+    def __init__(self, transaction):
+        self.transaction = transaction
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class MicroBatcher:
+    # Collects concurrent requests for one model and scores them as a single vectorized batch
+
+    def __init__(self, model, pipeline, score_fn, max_batch_size=256, max_wait_ms=2.0, velocity_store=None,
+                 date_cache=None, cache=None, cache_key=None):
+        self.model = model
+        self.pipeline = pipeline
+        self.score_fn = score_fn
+        self.velocity_store = velocity_store  # only touched by the batching thread
+        self.date_cache = date_cache  # thread-safe, may be shared with other batchers
+        self.cache = cache  # PredictionCache consulted before the model, keyed by cache_key and trans_num
+        self.cache_key = cache_key
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, transaction):
+        pending = _Pending(transaction)
+        self._queue.put(pending)
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._score(batch)
+
+    def _score(self, batch):
+        checkpoint = None
+        try:
+            df = pd.DataFrame.from_records([p.transaction for p in batch])
+            if self.velocity_store is not None:
+                checkpoint = self.velocity_store.checkpoint(customer_keys(df))
+            scores, is_fraud = predict_cached(df, self._predict, self.cache, self.cache_key)
+            for p, score, fraud in zip(batch, scores, is_fraud):
+                p.result = {
+                    "prediction": "Fraud Transaction" if fraud else "Normal Transaction",
+                    "is_fraud": bool(fraud),
+                    "score": float(score),
+                }
+        except Exception as e:
+            if checkpoint is not None:
+                # Forget the batch's velocity updates, or the retried transactions would count twice
+                self.velocity_store.rollback(checkpoint)
+            if len(batch) > 1:
+                # Score the requests one at a time, so only the record that fails gets the error
+                for p in batch:
+                    self._score([p])
+                return
+            batch[0].error = e
+        for p in batch:
+            p.done.set()
+
+    def _predict(self, df):
+        return self.score_fn(self.model, self.pipeline.transform_frame(df, self.velocity_store, self.date_cache))
+
+
+class ScoringService:
+    # Loads the current registry version of both models once and keeps them in memory
+
+    def __init__(self, max_batch_size=256, max_wait_ms=2.0, threshold=DEFAULT_THRESHOLD, cache_path=None):
+        score_functions = dict(SCORE_FUNCTIONS, xgboost=partial(score_xgboost, threshold=threshold))
+        self.batchers = {}
+        self.versions = {}
+        # Decoded dob strings, shared by both models: returning customers skip date parsing
+        self.date_cache = DateCache()
+        # Re-sent transactions (same trans_num and model version) are answered from the prediction cache
+        self.cache = PredictionCache(cache_path) if cache_path else None
+        for name in SCORE_FUNCTIONS:
+            entry = load_model(name)
+            # Velocity state is kept in memory and updated by every scored transaction
+            velocity_store = load_velocity_store(entry.velocity_path) if entry.pipeline.include_velocity else None
+            # Same key as the batch scripts and the app, so every path reuses the others' predictions.
+            # Velocity pipelines score without the cache: a hit would skip the store update.
+            cache = self.cache if velocity_store is None else None
+            key = entry.model_version
+            if name == "xgboost":
+                key = xgboost_cache_key(key, threshold)
+            self.batchers[name] = MicroBatcher(entry.model, entry.pipeline, score_functions[name],
+                                               max_batch_size, max_wait_ms, velocity_store, self.date_cache,
+                                               cache, key)
+            self.versions[name] = entry.version
+        self.latency = {name: LatencyTracker() for name in SCORE_FUNCTIONS}
+
+    def score(self, model_name, transaction):
+        transaction = validate_transaction(transaction)
+        start = time.perf_counter()
+        result = self.batchers[model_name].submit(transaction)
+        self.latency[model_name].record((time.perf_counter() - start) * 1000)
+        return result
+
+    def stats(self):
+        stats = {name: dict(tracker.summary(), version=self.versions[name]) for name, tracker in self.latency.items()}
+        stats["date_cache"] = self.date_cache.summary()
+        if self.cache is not None:
+            stats["prediction_cache"] = self.cache.summary()
+        return stats
+
+
+def make_handler(service):
+    class ScoringHandler(BaseHTTPRequestHandler):
+        # POST /score/<model> with one transaction as a JSON object; GET /stats for latency and the caches
+
+        def do_POST(self):
+            parts = self.path.strip('/').split('/')
+            if len(parts) != 2 or parts[0] != 'score' or parts[1] not in service.batchers:
+                self._send(404, {"error": f"unknown endpoint {self.path}"})
+                return
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+                transaction = json.loads(self.rfile.read(length))
+                if not isinstance(transaction, dict):
+                    raise ValueError("expected a single transaction object")
+                self._send(200, service.score(parts[1], transaction))
+            except (ValueError, KeyError) as e:
+                self._send(400, {"error": str(e)})
+            except Exception as e:  # still answer, so the client isn't left with a closed connection
+                self._send(500, {"error": f"internal error: {type(e).__name__}: {e}"})
+
+        def do_GET(self):
+            if self.path.rstrip('/') == '/stats':
+                self._send(200, service.stats())
+            else:
+                self._send(404, {"error": f"unknown endpoint {self.path}"})
+
+        def _send(self, status, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # keep per-request logging off the hot path
+
+    return ScoringHandler
+
+
+class ScoringServer(ThreadingHTTPServer):
+    request_queue_size = 1024  # the default backlog of 5 resets bursts of concurrent clients
+
+
+def serve(host="127.0.0.1", port=8000, max_batch_size=256, max_wait_ms=2.0, threshold=DEFAULT_THRESHOLD,
+          cache_path=None):
+    service = ScoringService(max_batch_size, max_wait_ms, threshold, cache_path)
+    server = ScoringServer((host, port), make_handler(service))
+    print(f"✅ Scoring service listening on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    finally:
+        if service.cache is not None:
+            service.cache.close()  # write back the predictions cached since the last periodic save
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Online fraud scoring service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--max-batch-size", type=int, default=256)
+    parser.add_argument("--max-wait-ms", type=float, default=2.0, help="Longest time a request waits for a batch to fill")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="XGBoost fraud probability that flags a transaction")
+    parser.add_argument("--cache", nargs="?", const=PREDICTION_CACHE_PATH, default=None, metavar="PATH",
+                        help="Answer re-sent transactions from this prediction cache file, keyed by trans_num")
+    args = parser.parse_args()
+    serve(args.host, args.port, args.max_batch_size, args.max_wait_ms, args.threshold, args.cache)
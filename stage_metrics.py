@@ -0,0 +1,235 @@
+import contextvars
+import cProfile
+import datetime
+import functools
+import json
+import os
+import pstats
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+try:
+    import resource  # POSIX only; elsewhere (Windows) memory is only reported from tracemalloc
+except ImportError:
+    resource = None
+
+# Default output directory: one JSON line per run in METRICS_LOG, one Prometheus text file per entry point
+METRICS_DIR = "metrics"
+METRICS_LOG = "stage_metrics.jsonl"
+
+# Prefix of every exported Prometheus metric
+PROMETHEUS_PREFIX = "fraud"
+
+# The run stages are recorded into; None outside a run, which makes every stage a no-op
+_current = contextvars.ContextVar("stage_metrics_run", default=None)
+
+
+def peak_rss_mb():
+    # High-water mark of the process so far, or None where resource is missing;
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+class StageMetrics:
+    # Wall time, rows and memory per pipeline stage for one run of an entry point.
+    # Stages nest ("preprocess/dates") and repeated stages, e.g. one per chunk, are summed.
+
+    def __init__(self, name):
+        self.name = name
+        self.stages = {}  # stage path -> {'calls', 'seconds', 'rows'[, 'peak_rss_mb'][, 'alloc_peak_mb']}
+        self.started = datetime.datetime.now(datetime.timezone.utc)
+        self.seconds = None
+        self._stack = []
+        self._alloc_peaks = []  # traced-allocation peak so far of each open stage
+        self._start = None
+        self._token = None
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, *exc):
+        # A run may be entered more than once (e.g. across app reruns); its seconds add up
+        self.seconds = (self.seconds or 0.0) + time.perf_counter() - self._start
+        _current.reset(self._token)
+
+    @contextmanager
+    def stage(self, name, rows=None):
+        # Yields the stage's record for this call; set record['rows'] when the count is only known inside
+        path = "/".join(self._stack + [name])
+        record = {'rows': rows}
+        # Registered on entry, so reports list parents before their sub-stages
+        totals = self.stages.setdefault(path, {'calls': 0, 'seconds': 0.0, 'rows': 0})
+        self._stack.append(name)
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            # reset_peak() is global, so hand the peak reached so far to the enclosing stages first
+            self._alloc_peaks = [max(peak, tracemalloc.get_traced_memory()[1]) for peak in self._alloc_peaks]
+            self._alloc_peaks.append(0)
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            seconds = time.perf_counter() - start
+            self._stack.pop()
+            totals['calls'] += 1
+            totals['seconds'] += seconds
+            totals['rows'] += record['rows'] or 0
+            rss = peak_rss_mb()
+            if rss is not None:
+                totals['peak_rss_mb'] = max(totals.get('peak_rss_mb', 0.0), rss)
+            if tracing:
+                # Peak of traced Python and NumPy allocations while the stage ran (python -X tracemalloc)
+                alloc_peak = max(self._alloc_peaks.pop(), tracemalloc.get_traced_memory()[1])
+                if self._alloc_peaks:
+                    self._alloc_peaks[-1] = max(self._alloc_peaks[-1], alloc_peak)
+                totals['alloc_peak_mb'] = max(totals.get('alloc_peak_mb', 0.0), alloc_peak / (1024 * 1024))
+
+    def merge(self, stages, prefix=None):
+        # Add the stages of another run, e.g. one recorded by a worker process, under prefix
+        for path, other in stages.items():
+            totals = self.stages.setdefault(f"{prefix}/{path}" if prefix else path,
+                                            {'calls': 0, 'seconds': 0.0, 'rows': 0})
+            for key, value in other.items():
+                totals[key] = max(totals.get(key, 0.0), value) if key.endswith('_mb') else totals[key] + value
+
+    @property
+    def rows(self):
+        return max((totals['rows'] for totals in self.stages.values()), default=0)
+
+    def report(self):
+        # One row per stage in the order stages first started; seconds of worker stages add up across processes
+        total = self.seconds or sum(t['seconds'] for path, t in self.stages.items() if "/" not in path)
+        return [{
+            'stage': path,
+            'calls': totals['calls'],
+            'seconds': round(totals['seconds'], 4),
+            'share': round(totals['seconds'] / total, 3) if total else None,
+            'rows': totals['rows'] or None,
+            'rows_per_sec': round(totals['rows'] / totals['seconds']) if totals['rows'] and totals['seconds'] else None,
+            **{key: round(value, 1) for key, value in totals.items() if key.endswith('_mb')},
+        } for path, totals in self.stages.items()]
+
+    def print_report(self):
+        for row in self.report():
+            rate = f"  {row['rows']:,} rows  {row['rows_per_sec']:,} rows/s" if row['rows_per_sec'] else ""
+            rss = f"  peak RSS {row['peak_rss_mb']:.0f} MB" if 'peak_rss_mb' in row else ""
+            alloc = f"  alloc peak {row['alloc_peak_mb']:.0f} MB" if 'alloc_peak_mb' in row else ""
+            print(f"⏱ {row['stage']}: {row['seconds']:.3f}s{rate}{rss}{alloc}")
+        if self.seconds is not None:
+            print(f"⏱ total: {self.seconds:.2f}s")
+
+    def to_json(self):
+        return {
+            'run': self.name,
+            'started': self.started.isoformat(timespec='seconds'),
+            'seconds': None if self.seconds is None else round(self.seconds, 4),
+            'rows': self.rows,
+            'peak_rss_mb': None if peak_rss_mb() is None else round(peak_rss_mb(), 1),
+            'argv': sys.argv,
+            'stages': self.report(),
+        }
+
+    def to_prometheus(self):
+        # Text exposition format, e.g. for node_exporter's textfile collector
+        metric = f"{PROMETHEUS_PREFIX}_stage"
+        lines = []
+        for name, help_text, key in (
+                ("seconds", "Wall time spent in the stage during the last run", 'seconds'),
+                ("rows", "Rows processed by the stage during the last run", 'rows'),
+                ("calls", "Times the stage ran during the last run", 'calls'),
+                ("peak_rss_bytes", "Process peak RSS when the stage last finished", 'peak_rss_mb')):
+            # Stages without the key (peak RSS where the resource module is missing) are left out
+            samples = [(path, totals[key]) for path, totals in self.stages.items() if key in totals]
+            if not samples:
+                continue
+            lines += [f"# HELP {metric}_{name} {help_text}", f"# TYPE {metric}_{name} gauge"]
+            for path, value in samples:
+                value = value * 1024 * 1024 if key.endswith('_mb') else value
+                lines.append(f'{metric}_{name}{{run="{self.name}",stage="{path}"}} {value:g}')
+        run_labels = f'{{run="{self.name}"}}'
+        lines += [
+            f"# HELP {PROMETHEUS_PREFIX}_run_seconds Wall time of the last run",
+            f"# TYPE {PROMETHEUS_PREFIX}_run_seconds gauge",
+            f"{PROMETHEUS_PREFIX}_run_seconds{run_labels} {self.seconds or 0:g}",
+            f"# HELP {PROMETHEUS_PREFIX}_run_rows Rows processed by the last run",
+            f"# TYPE {PROMETHEUS_PREFIX}_run_rows gauge",
+            f"{PROMETHEUS_PREFIX}_run_rows{run_labels} {self.rows}",
+            f"# HELP {PROMETHEUS_PREFIX}_run_timestamp_seconds Unix time the last run started",
+            f"# TYPE {PROMETHEUS_PREFIX}_run_timestamp_seconds gauge",
+            f"{PROMETHEUS_PREFIX}_run_timestamp_seconds{run_labels} {self.started.timestamp():.0f}",
+        ]
+        return "\n".join(lines) + "\n"
+
+    def save(self, metrics_dir=METRICS_DIR):
+        # Append the run to the JSON log and replace this entry point's Prometheus file
+        os.makedirs(metrics_dir, exist_ok=True)
+        with open(os.path.join(metrics_dir, METRICS_LOG), 'a') as f:
+            f.write(json.dumps(self.to_json(), default=str) + "\n")
+        prom_path = os.path.join(metrics_dir, f"{self.name}.prom")
+        with open(f"{prom_path}.tmp", 'w') as f:
+            f.write(self.to_prometheus())
+        os.replace(f"{prom_path}.tmp", prom_path)  # scrapers never read a half-written file
+        return prom_path
+
+
+def current_run():
+    return _current.get()
+
+
+def stage(name, rows=None):
+    # Time a stage of the current run; outside a run this costs one context variable lookup
+    run = _current.get()
+    return nullcontext({}) if run is None else run.stage(name, rows)
+
+
+def timed(name, rows=None):
+    # Decorator form of stage(); rows(result) gives the row count when the result carries it
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name) as record:
+                result = func(*args, **kwargs)
+                if rows is not None:
+                    record['rows'] = rows(result)
+            return result
+        return wrapper
+    return decorator
+
+
+def timed_iter(name, iterable):
+    # Time each next() of an iterator (e.g. reading chunks) as one call of the stage
+    iterator = iter(iterable)
+    while True:
+        with stage(name) as record:
+            item = next(iterator, None)
+            if item is not None and hasattr(item, '__len__'):
+                record['rows'] = len(item)
+        if item is None:
+            return
+        yield item
+
+
+@contextmanager
+def profiled(path=None, top=25):
+    # Opt-in cProfile of the block, saved to path for snakeviz/pstats; the top functions by
+    # cumulative time are printed. (py-spy needs nothing from here: py-spy record -- python ...)
+    if not path:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(top)
+        print(f"✅ Profile saved to {path}")
@@ -0,0 +1,60 @@
+import argparse
+import re
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+
+# Modules App.py loads on some page, roughly in the order a session meets them
+APP_MODULES = [
+    "streamlit", "pandas", "dataset", "fraud_aggregates", "customer_index", "matplotlib.pyplot", "seaborn",
+    "model_registry", "batch_scoring", "detect_fraud_isolate", "detect_fraud_xgboost", "xgboost",
+]
+
+# label -> cold import cost, recorded the first time each deferred import group runs in this process
+IMPORT_TIMES = {}
+
+
+@contextmanager
+def import_timer(label):
+    # Time the import statements inside the block; only the first (cold) run is kept, since
+    # later runs find every module in sys.modules
+    before = set(sys.modules)
+    start = time.perf_counter()
+    yield
+    if label not in IMPORT_TIMES:
+        new_packages = sorted({name.split('.')[0] for name in set(sys.modules) - before if not name.startswith('_')})
+        IMPORT_TIMES[label] = {
+            'imports': label,
+            'ms': round((time.perf_counter() - start) * 1000, 1),
+            'new packages': ", ".join(new_packages[:8]) + (" …" if len(new_packages) > 8 else ""),
+        }
+
+
+def import_report():
+    return sorted(IMPORT_TIMES.values(), key=lambda row: -row['ms'])
+
+
+def importtime_report(modules=APP_MODULES, top=20):
+    # Cold import cost per top-level package, from a fresh interpreter run with -X importtime
+    code = "\n".join(f"import {module}" for module in modules)
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True)
+    self_us = {}
+    for line in result.stderr.splitlines():
+        match = re.match(r"import time:\s+(\d+) \|\s+\d+ \|\s*(\S+)", line)
+        if match:
+            package = match.group(2).split('.')[0]
+            self_us[package] = self_us.get(package, 0) + int(match.group(1))
+    ranked = sorted(self_us.items(), key=lambda item: -item[1])
+    return [(package, us / 1000) for package, us in ranked[:top]], sum(self_us.values()) / 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show the cold import cost of the app's dependencies")
+    parser.add_argument("modules", nargs="*", default=APP_MODULES)
+    parser.add_argument("--top", type=int, default=20)
+    args = parser.parse_args()
+    ranked, total_ms = importtime_report(args.modules, args.top)
+    for package, ms in ranked:
+        print(f"{package:<24}{ms:>10.1f} ms")
+    print(f"⏱ {'total':<22}{total_ms:>10.1f} ms")
@@ -0,0 +1,46 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from batch_scoring import predict_frame
+from feature_pipeline import FeaturePipeline
+from prediction_cache import PredictionCache
+from velocity_store import VelocityStore
+
+# Sample transactions shipped with the repo
+SAMPLE_PATH = os.path.join(os.path.dirname(__file__), "fake_transactions.csv")
+
+
+def _score(features):
+    return np.zeros(len(features)), np.zeros(len(features), dtype=bool)
+
+
+def test_velocity_pipeline_refuses_prediction_cache(tmp_path):
+    # Cache hits skip transform_frame, so they would never reach the velocity store
+    df = pd.read_csv(SAMPLE_PATH, nrows=50)
+    pipeline = FeaturePipeline(include_velocity=True).fit(df)
+    store = VelocityStore()
+    with PredictionCache(str(tmp_path / "cache.npz")) as cache:
+        with pytest.raises(ValueError, match="velocity"):
+            predict_frame(df, pipeline, _score, store, cache, "isolation_forest/v1")
+    assert store.updates == 0
+
+    predict_frame(df, pipeline, _score, store)
+    assert store.updates == len(df)
+
+
+def test_stateless_pipeline_answers_repeats_from_cache(tmp_path):
+    df = pd.read_csv(SAMPLE_PATH, nrows=50)
+    pipeline = FeaturePipeline().fit(df)
+    calls = []
+
+    def score(features):
+        calls.append(len(features))
+        return _score(features)
+
+    with PredictionCache(str(tmp_path / "cache.npz")) as cache:
+        predict_frame(df, pipeline, score, cache=cache, cache_key="isolation_forest/v1")
+        predict_frame(df, pipeline, score, cache=cache, cache_key="isolation_forest/v1")
+    assert calls == [len(df)]
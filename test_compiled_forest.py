@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import IsolationForest
+
+from compiled_forest import LARGE_BATCH_ROWS, compile_forest, load_forest_arrays
+
+
+@pytest.fixture(scope="module")
+def data():
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(3000, 8))
+    X[:, 3] = rng.integers(0, 5, size=len(X))  # repeated values put rows exactly on thresholds
+    return pd.DataFrame(X, columns=[f"f{i}" for i in range(X.shape[1])])
+
+
+@pytest.fixture(scope="module")
+def model(data):
+    return IsolationForest(n_estimators=500, max_features=0.6, contamination='auto', random_state=42).fit(data)
+
+
+@pytest.fixture(scope="module")
+def mapped(model, tmp_path_factory):
+    # The registry path: node arrays saved as .npy and memory-mapped back, without the sklearn model
+    directory = tmp_path_factory.mktemp("forest")
+    info = compile_forest(model).save_arrays(directory)
+    return load_forest_arrays(directory, info)
+
+
+@pytest.mark.parametrize("rows", [1, LARGE_BATCH_ROWS - 1, LARGE_BATCH_ROWS, 2500])
+def test_decision_function_matches_sklearn(model, data, rows):
+    X = data.iloc[:rows]
+    np.testing.assert_allclose(compile_forest(model).decision_function(X), model.decision_function(X),
+                               rtol=0, atol=1e-12)
+
+
+@pytest.mark.parametrize("rows", [1, LARGE_BATCH_ROWS - 1, LARGE_BATCH_ROWS, 2500])
+def test_from_arrays_matches_sklearn(model, mapped, data, rows):
+    X = data.iloc[:rows]
+    assert isinstance(mapped.threshold, np.memmap)
+    np.testing.assert_allclose(mapped.decision_function(X), model.decision_function(X), rtol=0, atol=1e-12)
+    np.testing.assert_array_equal(mapped.predict(X), model.predict(X))
+
+
+def test_single_sample_forest():
+    X = np.array([[1.0, 2.0]])
+    model = IsolationForest(n_estimators=10, random_state=0).fit(X)
+    forest = compile_forest(model)
+    np.testing.assert_array_equal(forest.score_samples(X), model.score_samples(X))
+    np.testing.assert_array_equal(forest.predict(X), model.predict(X))
+
+
+def test_feature_names_are_checked(model, data):
+    with pytest.raises(ValueError):
+        compile_forest(model).decision_function(data[data.columns[::-1]])
@@ -0,0 +1,48 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from feature_pipeline import CATEGORICAL_COLS, FeaturePipeline
+
+
+# Sample transactions shipped with the repo
+SAMPLE_PATH = os.path.join(os.path.dirname(__file__), "fake_transactions.csv")
+
+
+@pytest.fixture
+def df():
+    df = pd.read_csv(SAMPLE_PATH, nrows=200)
+    df.loc[3, 'category'] = np.nan
+    df.loc[7, 'city'] = None
+    return df
+
+
+def test_fit_and_transform_with_missing_categoricals(df):
+    pipeline = FeaturePipeline().fit(df)
+    assert "nan" in pipeline.lookup_tables['category']
+    X = pipeline.transform(df)
+    index = pipeline.feature_names.index('category')
+    assert X[3, index] == pipeline.lookup_tables['category'].get_loc("nan")
+    # Same codes the old astype(str) + LabelEncoder preprocessing gave
+    for col in CATEGORICAL_COLS:
+        labels = df[col].astype(object).where(df[col].notna(), "nan").astype(str)
+        expected = np.searchsorted(np.unique(labels), labels)
+        np.testing.assert_array_equal(X[:, pipeline.feature_names.index(col)], expected)
+
+
+def test_partial_fit_with_missing_categoricals(df):
+    pipeline = FeaturePipeline()
+    for start in range(0, len(df), 50):
+        pipeline.partial_fit(df.iloc[start:start + 50])
+    full = FeaturePipeline().fit(df)
+    for col in CATEGORICAL_COLS:
+        assert list(pipeline.lookup_tables[col]) == list(full.lookup_tables[col])
+    np.testing.assert_array_equal(pipeline.transform(df), full.transform(df))
+
+
+def test_missing_category_in_columnar_input(df):
+    pipeline = FeaturePipeline().fit(df)
+    columnar = df.astype({col: 'category' for col in CATEGORICAL_COLS})
+    np.testing.assert_array_equal(pipeline.transform(columnar), pipeline.transform(df))
@@ -0,0 +1,53 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from customer_index import customer_keys
+from feature_pipeline import FeaturePipeline
+from scoring_service import MicroBatcher, _Pending
+from velocity_store import VelocityStore
+
+# Sample transactions shipped with the repo
+SAMPLE_PATH = os.path.join(os.path.dirname(__file__), "fake_transactions.csv")
+
+# amt that makes the stand-in model fail, after the batch already went through the velocity store
+FAILING_AMOUNT = 666.0
+
+
+def _score(model, features):
+    if (np.asarray(features)[:, model['amt']] == FAILING_AMOUNT).any():
+        raise RuntimeError("model failed")
+    return np.zeros(len(features)), np.zeros(len(features), dtype=bool)
+
+
+def _transactions():
+    # One customer's transactions a minute apart, plus a few other customers
+    df = pd.read_csv(SAMPLE_PATH, nrows=10)
+    same = pd.concat([df.iloc[[0]]] * 6, ignore_index=True)
+    same['trans_date_trans_time'] = pd.date_range("2024-01-01 10:00", periods=6, freq="min").strftime("%Y-%m-%d %H:%M:%S")
+    same['trans_num'] = [f"t{i}" for i in range(6)]
+    return pd.concat([same, df.iloc[1:]], ignore_index=True)
+
+
+def test_failed_batch_does_not_count_transactions_twice():
+    df = _transactions()
+    df.loc[3, 'amt'] = FAILING_AMOUNT
+    pipeline = FeaturePipeline(include_velocity=True).fit(df)
+    store = VelocityStore()
+    model = {'amt': pipeline.feature_names.index('amt')}
+    batcher = MicroBatcher(model, pipeline, _score, velocity_store=store)
+
+    batch = [_Pending(row) for row in df.to_dict('records')]
+    batcher._score(batch)
+    assert [p.error is not None for p in batch] == [i == 3 for i in range(len(df))]
+
+    # The store holds each successfully scored transaction exactly once
+    expected = VelocityStore()
+    expected.update_frame(df.drop(index=3))
+    assert store.customers.keys() == expected.customers.keys()
+    for key, state in expected.customers.items():
+        assert store.customers[key].counts == state.counts
+        assert store.customers[key].sums == state.sums
+    assert store.customers[customer_keys(df.iloc[[0]])[0]].counts['1h'] == 5
+    assert store.updates == len(df) - 1
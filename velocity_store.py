@@ -0,0 +1,127 @@
+from collections import deque
+
+import joblib
+import numpy as np
+
+from customer_index import customer_keys
+from date_features import parse_datetimes
+
+# Snapshot written by the trainer and picked up by the scoring entry points
+# (the XGBoost scripts keep theirs in velocity_store_xgboost.pkl)
+VELOCITY_STORE_PATH = "velocity_store.pkl"
+
+# Sliding windows in seconds
+WINDOWS = {'1h': 3600, '24h': 24 * 3600, '7d': 7 * 24 * 3600}
+
+# Feature columns produced per transaction, in this order
+VELOCITY_FEATURES = [f'{stat}_{name}' for name in WINDOWS for stat in ('count', 'amt_sum')] + ['seconds_since_last']
+
+# Sweep idle customers out of the store after this many updates
+EVICT_EVERY = 100_000
+
+
+def _epoch_seconds(values):
+    stamps = parse_datetimes(values)
+    seconds = stamps.astype(np.int64).astype(np.float64)
+    seconds[np.isnat(stamps)] = np.nan
+    return seconds
+
+
+class _CustomerState:
+    __slots__ = ('events', 'counts', 'sums', 'last_ts')
+
+    def __init__(self):
+        self.events = {name: deque() for name in WINDOWS}  # (timestamp, amount) per window
+        self.counts = dict.fromkeys(WINDOWS, 0)
+        self.sums = dict.fromkeys(WINDOWS, 0.0)
+        self.last_ts = None
+
+    def copy(self):
+        # Events are immutable tuples, so copying the deques is enough
+        state = _CustomerState.__new__(_CustomerState)
+        state.events = {name: deque(events) for name, events in self.events.items()}
+        state.counts = dict(self.counts)
+        state.sums = dict(self.sums)
+        state.last_ts = self.last_ts
+        return state
+
+
+class VelocityStore:
+    # Per-customer transaction counts and amount sums over sliding 1h/24h/7d windows.
+    # Each update appends to one deque per window and pops what fell out of it, so it
+    # costs O(1) amortized; events are expected in (roughly) time order per customer.
+
+    def __init__(self):
+        self.customers = {}
+        self.updates = 0
+        self.latest_ts = float('-inf')
+
+    def update(self, key, ts, amount):
+        # Record one transaction and return its features (including the transaction itself)
+        state = self.customers.get(key)
+        if state is None:
+            state = self.customers[key] = _CustomerState()
+        since_last = -1.0 if state.last_ts is None else ts - state.last_ts
+
+        features = []
+        for name, window in WINDOWS.items():
+            events = state.events[name]
+            events.append((ts, amount))
+            state.counts[name] += 1
+            state.sums[name] += amount
+            while events[0][0] <= ts - window:
+                _, old_amount = events.popleft()
+                state.counts[name] -= 1
+                state.sums[name] -= old_amount
+            features += [state.counts[name], state.sums[name]]
+        features.append(since_last)
+
+        state.last_ts = ts if state.last_ts is None else max(state.last_ts, ts)
+        self.latest_ts = max(self.latest_ts, ts)
+        self.updates += 1
+        if self.updates % EVICT_EVERY == 0:
+            self.evict_expired()
+        return features
+
+    def update_frame(self, df):
+        # Feed a batch in timestamp order and return its features in the original row order
+        keys = customer_keys(df)
+        ts = _epoch_seconds(df['trans_date_trans_time'])
+        amounts = df['amt'].to_numpy(dtype=np.float64, na_value=0)
+
+        out = np.zeros((len(df), len(VELOCITY_FEATURES)), dtype=np.float32)
+        for i in np.argsort(ts, kind='stable'):
+            if np.isnan(ts[i]):
+                continue  # no usable timestamp: leave zeros and don't touch the state
+            out[i] = self.update(keys[i], ts[i], amounts[i])
+        return out
+
+    def checkpoint(self, keys):
+        # Copies of these customers' states and of the counters, taken before a batch that may fail;
+        # rollback() undoes every update the batch made to them
+        states = {key: state.copy() if (state := self.customers.get(key)) is not None else None
+                  for key in set(keys.tolist())}
+        return states, self.updates, self.latest_ts
+
+    def rollback(self, checkpoint):
+        states, self.updates, self.latest_ts = checkpoint
+        for key, state in states.items():
+            if state is None:
+                self.customers.pop(key, None)
+            else:
+                self.customers[key] = state
+
+    def evict_expired(self):
+        # Drop customers with no transaction inside the longest window
+        horizon = self.latest_ts - max(WINDOWS.values())
+        for key in [k for k, state in self.customers.items() if state.last_ts <= horizon]:
+            del self.customers[key]
+
+    def save(self, path=VELOCITY_STORE_PATH):
+        self.evict_expired()
+        joblib.dump(self, path)
+
+
+def load_velocity_store(path=VELOCITY_STORE_PATH):
+    # Snapshot written by a trainer or a previous scoring run
+    return joblib.load(path)